@@ -1,11 +1,13 @@
 import os
 from flask import Flask, jsonify, send_from_directory
 from werkzeug.middleware.proxy_fix import ProxyFix # 1. 导入 ProxyFix
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+import click
 # 从 .models 模块导入 db 实例
 # 导入模型类是为了让 Flask-Migrate 能够识别它们
 from .models.models import db, User, Admin, Location, Review, Category, Tag
@@ -18,6 +20,11 @@ from .routers.admin_routes import admin_bp
 from .routers.routes import routes_bp # --- 新增导入 ---
 # --- 新增：导入 search_bp ---
 from .routers.search import search_bp
+from .services.review_counters import reconcile_review_counters, refresh_review_scores
+from .services.image_store import collect_unreferenced_images
+from .services.message_counters import reconcile_unread_counts
+from .services.near_duplicates import backfill_simhash
+from .services.uploads import UploadRequest
 
 def create_app():
     # --- 新增的调试日志 ---
@@ -27,11 +34,41 @@ def create_app():
     """
     # 修改 Flask 实例的创建，指定静态文件路径
     app = Flask(__name__, static_folder='static', static_url_path='')
+    # --- 新增：上传文件在解析时流式落盘，并按接口限制大小 ---
+    app.request_class = UploadRequest
     
     # --- 新增：配置上传文件夹 ---
     # 路径相对于项目根目录
     app.config['UPLOAD_FOLDER'] = 'backend/static/uploads'
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 限制上传大小为 16MB
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 # 默认上传大小上限 16MB，上传接口通过 upload_limits 单独设置
+    # --- 新增：后台图片处理进程数 ---
+    app.config['IMAGE_PROCESS_WORKERS'] = int(os.environ.get('IMAGE_PROCESS_WORKERS', 2))
+    # --- 新增：点赞/回复/举报通知的合并窗口（秒），<= 0 时立即写入 ---
+    app.config['NOTIFY_COALESCE_SECONDS'] = float(os.environ.get('NOTIFY_COALESCE_SECONDS', 10))
+    # --- 新增：操作日志异步批量写入的间隔（秒，<= 0 时提交后立即写入）和缓冲区容量 ---
+    app.config['AUDIT_LOG_FLUSH_SECONDS'] = float(os.environ.get('AUDIT_LOG_FLUSH_SECONDS', 2))
+    app.config['AUDIT_LOG_BUFFER_SIZE'] = int(os.environ.get('AUDIT_LOG_BUFFER_SIZE', 10000))
+    # 高频操作的采样率，格式 "ADD_HISTORY=0.1,MARK_MESSAGE_READ=0.1"
+    app.config['AUDIT_LOG_SAMPLE_RATES'] = {
+        action.strip(): float(rate)
+        for action, rate in (
+            item.split('=', 1)
+            for item in os.environ.get('AUDIT_LOG_SAMPLE_RATES', 'ADD_HISTORY=0.1,MARK_MESSAGE_READ=0.1').split(',')
+            if '=' in item
+        )
+    }
+    # --- 新增：密码哈希参数（Werkzeug method 写法）和同时计算的线程数 ---
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 4))
+    # 登录限流：(令牌桶容量, 恢复一个令牌所需秒数)
+    app.config['LOGIN_THROTTLE_PHONE'] = (5, 60)
+    app.config['LOGIN_THROTTLE_IP'] = (30, 2)
+    # --- 新增：每个进程的消息推送 (SSE) 连接数上限 ---
+    app.config['MESSAGE_STREAM_MAX_CONNECTIONS'] = int(os.environ.get('MESSAGE_STREAM_MAX_CONNECTIONS', 100))
+    # 单个连接的最长秒数，需低于代理的读超时，0 为不限制
+    app.config['MESSAGE_STREAM_MAX_SECONDS'] = int(os.environ.get('MESSAGE_STREAM_MAX_SECONDS', 25))
+    # --- 新增：敏感词表文件（每行一个词），与系统设置 sensitive_words 合并使用 ---
+    app.config['SENSITIVE_WORDS_FILE'] = os.environ.get('SENSITIVE_WORDS_FILE')
 
     # 确保上传文件夹存在
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -89,6 +126,51 @@ def create_app():
     app.register_blueprint(routes_bp) # --- 新增注册 ---
     app.register_blueprint(search_bp)
 
+    # --- 新增：命令行工具 ---
+    @app.cli.command('reconcile-review-counters')
+    def reconcile_review_counters_command():
+        """根据点赞和回复记录重新计算评论的冗余计数"""
+        updated = reconcile_review_counters()
+        db.session.commit()
+        print(f"已校准 {updated} 条评论的计数")
+
+    @app.cli.command('reconcile-unread-counts')
+    def reconcile_unread_counts_command():
+        """根据消息记录重新计算用户的未读消息数"""
+        updated = reconcile_unread_counts()
+        db.session.commit()
+        print(f"已校准 {updated} 个用户的未读数")
+
+    @app.cli.command('decay-review-scores')
+    def decay_review_scores_command():
+        """刷新近期评论的热度和 top 分数，建议每 10 分钟左右运行一次"""
+        updated = refresh_review_scores()
+        db.session.commit()
+        print(f"已刷新 {updated} 条评论的排名分数")
+
+    @app.cli.command('collect-image-blobs')
+    @click.option('--grace-hours', default=1, show_default=True, help='无引用图片的保留时间（小时）')
+    def collect_image_blobs_command(grace_hours):
+        """删除没有被任何评论或头像引用的图片文件"""
+        removed = collect_unreferenced_images(timedelta(hours=grace_hours))
+        print(f"已回收 {removed} 张无引用图片")
+
+    @app.cli.command('backfill-simhash')
+    @click.option('--batch-size', default=1000, show_default=True, help='每批处理的行数')
+    def backfill_simhash_command(batch_size):
+        """为近似重复检测上线前的评论和回复补算 simhash 指纹"""
+        updated = backfill_simhash(batch_size)
+        print(f"已回填 {updated} 条记录的指纹")
+
+    # --- 新增：上传超限时返回 JSON 错误 ---
+    @app.errorhandler(413)
+    @app.errorhandler(415)
+    def upload_rejected(e):
+        message = e.description
+        if e.code == 413 and message == RequestEntityTooLarge.description:
+            message = "上传内容过大"
+        return jsonify({"success": False, "message": message}), e.code
+
     # --- 定义根路由/健康检查路由 ---
     @app.route('/')
     def index():
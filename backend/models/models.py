@@ -34,6 +34,8 @@ class User(db.Model):
     role = db.Column(db.String(50), default='user', nullable=False)
     ban_reason = db.Column(db.String(255))
     ban_until = db.Column(db.DateTime)
+    # --- 新增：未读消息数，随消息写入/已读/删除维护，角标轮询直接读取 ---
+    unread_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     # ... (之前的 relationships 和 methods) ...
     favorites = db.relationship('Favorite', backref='user', lazy=True, cascade="all, delete-orphan")
@@ -84,11 +86,15 @@ class Location(db.Model):
     # --- 新增：经纬度字段 ---
     longitude = db.Column(db.Float)
     latitude = db.Column(db.Float)
+    # --- 新增：变更序号，用于地图数据增量同步 ---
+    change_seq = db.Column(db.BigInteger, default=0, nullable=False, index=True)
     # ... (之前的 relationships) ...
     category = db.relationship('Category', backref='locations')
     reviews = db.relationship('Review', backref='location', lazy=True, cascade="all, delete-orphan")
     # --- 核心修复：将 backref 修改为 back_populates ---
     wiki_suggestions = db.relationship('WikiSuggestion', back_populates='location', lazy='dynamic', cascade="all, delete-orphan")
+    # --- 新增：Wiki 修订历史 ---
+    revisions = db.relationship('WikiRevision', backref='location', lazy='dynamic', cascade="all, delete-orphan")
 
     tags = db.relationship('Tag', secondary=location_tags, lazy='subquery', backref=db.backref('locations', lazy=True))
 
@@ -97,6 +103,21 @@ class Location(db.Model):
     # replies = db.relationship('ReviewReply', back_populates='review', lazy='dynamic', cascade='all, delete-orphan')
     # suggestions = db.relationship('WikiSuggestion', backref='location', lazy=True, cascade="all, delete-orphan")
 
+# --- 新增：地点硬删除后的墓碑记录，供增量同步通知客户端移除 ---
+class LocationTombstone(db.Model):
+    __tablename__ = 'location_tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, nullable=False)
+    building_id = db.Column(db.Integer, nullable=True)
+    change_seq = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+# --- 新增：单调递增序号计数器 ---
+class SyncSequence(db.Model):
+    __tablename__ = 'sync_sequences'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+
 class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
@@ -118,7 +139,7 @@ class Review(db.Model):
     location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
 
     # 新增字段
-    status = db.Column(db.String(20), default='pending', nullable=False) # pending, approved, rejected
+    status = db.Column(db.String(20), default='pending', nullable=False) # pending, approved, rejected, flagged（疑似重复，审核前不公开）
     # --- 核心修复：统一使用 back_populates 定义双向关系 ---
     likes = db.relationship('ReviewLike', back_populates='review', lazy='dynamic', cascade="all, delete-orphan")
     replies = db.relationship('ReviewReply', back_populates='review', lazy='dynamic', cascade="all, delete-orphan")
@@ -129,12 +150,65 @@ class Review(db.Model):
     # --- 新增：审核备注 ---
     reviewer_note = db.Column(db.Text, nullable=True)
 
+    # --- 新增：冗余计数，随点赞/回复在同一事务内原子更新 ---
+    like_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    reply_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    # --- 新增：预先计算的排名分数，sort=hot/top 直接按索引排序 ---
+    hot_score = db.Column(db.Double, default=0, server_default='0', nullable=False) # 随时间衰减的热度
+    top_score = db.Column(db.Double, default=0, server_default='0', nullable=False) # 每天互动量的贝叶斯平均
+
+    # --- 新增：正文的 SimHash 指纹（有符号 64 位），用于近似重复检测 ---
+    simhash = db.Column(db.BigInteger, nullable=True)
+
+    # --- 新增：游标分页使用的复合索引 ---
+    __table_args__ = (
+        db.Index('ix_reviews_location_created_id', 'location_id', 'created_at', 'id'),
+        db.Index('ix_reviews_location_hot_id', 'location_id', 'hot_score', 'id'),
+        db.Index('ix_reviews_location_top_id', 'location_id', 'top_score', 'id'),
+        # “我的评论”按用户分页
+        db.Index('ix_reviews_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
     # tags = db.relationship('Tag', secondary=db.Table('review_tags', db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True), db.Column('review_id', db.Integer, db.ForeignKey('reviews.id'), primary_key=True)), lazy='subquery', backref=db.backref('reviews', lazy=True))
     # # --- 新增：评论的回复列表 ---
     # replies = db.relationship('ReviewReply', back_populates='review', lazy='dynamic', cascade='all, delete-orphan')
     # # 新增：评论收到的举报列表
     # reports = db.relationship('ReviewReport', back_populates='review', lazy='dynamic', cascade='all, delete-orphan')
 
+# --- 新增：上传图片的元数据（尺寸、变体、处理状态） ---
+class ImageAsset(db.Model):
+    __tablename__ = 'image_assets'
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(255), unique=True, nullable=False, index=True) # 原图 Web 路径
+    # --- 新增：内容寻址存储，相同内容只保存一份 ---
+    sha256 = db.Column(db.String(64), unique=True, nullable=True, index=True)
+    size_bytes = db.Column(db.Integer, nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(JSON, nullable=True) # {"thumb": {"width", "height", "webp", "jpeg"}, "medium": {...}}
+    status = db.Column(db.String(20), default='pending', nullable=False) # pending, ready, failed
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    refs = db.relationship('ImageRef', backref='asset', lazy='dynamic', cascade="all, delete-orphan")
+
+# --- 新增：图片引用表，记录图片被哪些评论/用户头像使用 ---
+class ImageRef(db.Model):
+    __tablename__ = 'image_refs'
+    id = db.Column(db.Integer, primary_key=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('image_assets.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False) # review, avatar
+    # 引用方随评论/用户删除而级联删除，图片变为无引用后由回收任务清理
+    review_id = db.Column(db.Integer, db.ForeignKey('reviews.id', ondelete='CASCADE'), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('asset_id', 'review_id', name='_asset_review_uc'),
+        db.UniqueConstraint('asset_id', 'user_id', name='_asset_user_uc'),
+    )
+
 # --- 新增：标签模型 ---
 class Tag(db.Model):
     __tablename__ = 'tags'
@@ -182,12 +256,22 @@ class ReviewReply(db.Model):
     # 外键
     review_id = db.Column(db.Integer, db.ForeignKey('reviews.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+
+    # --- 新增：正文的 SimHash 指纹（有符号 64 位），用于近似重复检测 ---
+    simhash = db.Column(db.BigInteger, nullable=True)
     
     # 关系
     review = db.relationship('Review', back_populates='replies')
     # 新增：回复收到的举报列表
     reports = db.relationship('ReviewReplyReport', back_populates='reply', lazy='dynamic', cascade='all, delete-orphan')
 
+    # --- 新增：回复游标分页使用的复合索引 ---
+    __table_args__ = (
+        db.Index('ix_review_replies_review_created_id', 'review_id', 'created_at', 'id'),
+        # “我的评论”按用户分页
+        db.Index('ix_review_replies_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
 # --- 新增：评论回复举报模型 ---
 class ReviewReplyReport(db.Model):
     __tablename__ = 'review_reply_reports'
@@ -229,6 +313,33 @@ class WikiSuggestion(db.Model):
     author = db.relationship('User', back_populates='wiki_suggestions')
     location = db.relationship('Location', back_populates='wiki_suggestions')
 
+
+# --- 新增：Wiki 修订历史模型 ---
+class WikiRevision(db.Model):
+    """
+    Wiki 正文 (rich_content) 的修订记录。
+    每隔若干个修订保存一次完整快照，其余修订只保存相对上一修订的增量。
+    """
+    __tablename__ = 'wiki_revisions'
+    id = db.Column(db.Integer, primary_key=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id', ondelete='CASCADE'), nullable=False, index=True)
+    revision_number = db.Column(db.Integer, nullable=False)
+    is_snapshot = db.Column(db.Boolean, default=False, nullable=False)
+    snapshot = db.Column(db.Text, nullable=True) # 快照修订：完整正文
+    delta = db.Column(JSON, nullable=True) # 增量修订：相对上一修订的操作序列
+    content_length = db.Column(db.Integer, default=0, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False) # 完整正文的 SHA-256，用于去重和校验
+    source = db.Column(db.String(20), default='edit', nullable=False) # initial, edit, suggestion, import
+    note = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    # 修改者：Wiki 编辑可能是普通用户 (wiki_editor) 或管理员
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    admin_id = db.Column(db.Integer, db.ForeignKey('admins.id', ondelete='SET NULL'), nullable=True)
+    suggestion_id = db.Column(db.Integer, nullable=True) # 来源于 Wiki 建议时记录建议 ID
+
+    __table_args__ = (db.UniqueConstraint('location_id', 'revision_number', name='_location_revision_uc'),)
+
     
 class Favorite(db.Model):
     __tablename__ = 'favorites'
@@ -238,7 +349,11 @@ class Favorite(db.Model):
     wiki_id = db.Column(db.Integer, nullable=True) # 假设与百科/文章关联
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     # 可以添加一个唯一约束确保一个用户对一个项目只能收藏一次
-    __table_args__ = (db.UniqueConstraint('user_id', 'building_id', name='_user_building_uc'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'building_id', name='_user_building_uc'),
+        # --- 新增：收藏列表游标分页使用的复合索引 ---
+        db.Index('ix_favorites_user_created_id', 'user_id', 'created_at', 'id'),
+    )
 
 # --- 新增后台管理模型 ---
 
@@ -301,6 +416,12 @@ class Message(db.Model):
     # --- 关系 ---
     review = db.relationship('Review')
 
+    # --- 新增：消息列表游标分页（全部 / 仅未读）使用的复合索引 ---
+    __table_args__ = (
+        db.Index('ix_messages_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_messages_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
 # --- 新增：路线收藏模型 ---
 class FavoriteRoute(db.Model):
     __tablename__ = 'favorite_routes'
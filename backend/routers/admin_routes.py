@@ -2,9 +2,9 @@ from flask import Blueprint, request, jsonify, current_app # <-- 新增导入 cu
 from sqlalchemy import or_, func, distinct
 from ..models.models import (
     db, User, Location, Review, WikiSuggestion, Admin, ActionLog, 
-    SystemSetting, ReviewReport, Category,
+    SystemSetting, ReviewReport, Category, WikiRevision,
     # --- 新增导入 ---
-    UserLoginLog, LocationView, SearchLog, UserLog, Tag
+    UserLoginLog, LocationView, SearchLog, UserLog
 )
 from sqlalchemy.exc import IntegrityError # <-- 新增导入
 from werkzeug.utils import secure_filename # <-- 新增导入
@@ -12,6 +12,13 @@ import os # <-- 新增导入
 import csv # <-- 新增导入
 import io  # <-- 新增导入
 from .auth import admin_required, create_admin_token, wiki_editor_required
+from ..services.wiki_revisions import record_wiki_revision, reconstruct_revision, diff_contents
+from ..services.location_sync import next_location_seq
+from ..services.uploads import upload_limits
+from ..services.tags import resolve_tags, normalize_tag_name, InvalidTagName
+from ..services.image_store import store_image, replace_avatar_ref, BLOB_SUBFOLDER
+from ..services.sensitive_words import invalidate_sensitive_words
+from ..services.audit_log import audit_log_stats
 import datetime
 import jwt
 import json
@@ -89,7 +96,17 @@ def get_stats(current_admin):
         "activeUsers": active_count,
         "bannedUsers": banned_count,
         "totalLocations": Location.query.count(),
-        "pendingReviews": Review.query.filter_by(status='pending').count()
+        "pendingReviews": Review.query.filter(Review.status.in_(('pending', 'flagged'))).count()
+    })
+
+# --- 新增：操作日志异步写入的运行指标（本进程） ---
+@admin_bp.route('/stats/audit-log', methods=['GET'])
+@admin_required
+def get_audit_log_stats(current_admin):
+    return jsonify({
+        **audit_log_stats(),
+        "bufferSize": current_app.config.get('AUDIT_LOG_BUFFER_SIZE'),
+        "sampleRates": current_app.config.get('AUDIT_LOG_SAMPLE_RATES', {})
     })
 
 # --- 新增：头像上传配置 (根据文档) ---
@@ -133,6 +150,7 @@ def get_accounts_list(current_admin):
 # --- 新增：用户头像上传接口 (根据文档) ---
 @admin_bp.route('/account/<int:user_id>/avatar', methods=['POST'])
 @admin_required
+@upload_limits(MAX_FILE_SIZE, allowed_extensions=ALLOWED_EXTENSIONS)
 def upload_user_avatar(current_admin, user_id):
     """上传用户头像"""
     if current_admin.role != 'admin':
@@ -153,40 +171,24 @@ def upload_user_avatar(current_admin, user_id):
     if not allowed_file(file.filename):
         return jsonify({"message": "不支持的文件格式，仅支持 JPG、PNG、GIF"}), 400
     
-    # 检查文件大小
-    file.seek(0, os.SEEK_END)
-    if file.tell() > MAX_FILE_SIZE:
-        return jsonify({"message": f"文件过大，最大支持 {MAX_FILE_SIZE / 1024 / 1024}MB"}), 413
-    file.seek(0)
-    
-    # 生成安全且唯一的文件名
-    ext = file.filename.rsplit('.', 1)[1].lower()
-    timestamp = int(datetime.datetime.now().timestamp())
-    filename = secure_filename(f"user_{user_id}_{timestamp}.{ext}")
-    
-    # 确保上传目录存在
-    upload_path = os.path.join(current_app.root_path, AVATAR_UPLOAD_FOLDER)
-    os.makedirs(upload_path, exist_ok=True)
-    
-    filepath = os.path.join(upload_path, filename)
-    
-    # 删除旧头像 (可选但推荐)
-    if user.avatar_url:
+    # 删除旧头像（仅限旧版按用户命名的文件；内容寻址存储中的图片由回收任务处理）
+    if user.avatar_url and not user.avatar_url.startswith(f"/uploads/{BLOB_SUBFOLDER}/"):
         try:
-            # 假设 avatar_url 存储的是 /static/images/avatars/filename.jpg 格式
             old_filename = os.path.basename(user.avatar_url)
-            old_filepath = os.path.join(upload_path, old_filename)
+            old_filepath = os.path.join(current_app.root_path, AVATAR_UPLOAD_FOLDER, old_filename)
             if os.path.exists(old_filepath):
                 os.remove(old_filepath)
         except Exception as e:
             print(f"删除旧头像失败: {e}") # 记录错误，但不中断流程
 
-    # 保存新文件
-    file.save(filepath)
-    
+    # 按内容哈希保存
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    asset, _ = store_image(file.stream, ext)
+
     # 更新数据库中的头像URL
-    avatar_url = f"/uploads/avatars/{filename}"
+    avatar_url = asset.path
     user.avatar_url = avatar_url
+    replace_avatar_ref(user, asset)
     db.session.commit()
     
     return jsonify({
@@ -500,7 +502,10 @@ def approve_content_review(current_admin, content_id):
     # --- 核心修改：当通过 Wiki 建议时，应用其内容到地点 ---
     if content_type == 'suggestion' and item.location and item.content:
         # 只有当建议关联了地点且有内容时才更新
+        previous_content = item.location.rich_content
         item.location.rich_content = item.content
+        record_wiki_revision(item.location, item.content, editor=current_admin, source='suggestion',
+                             previous_content=previous_content, suggestion_id=item.id)
 
     db.session.commit()
     # 返回前端期望的、包含更新后状态的响应
@@ -736,7 +741,11 @@ def batch_process_suggestions(current_admin):
                 suggestion.status = 'approved'
                 # 应用 Wiki 更新到地点
                 if suggestion.location:
+                    previous_content = suggestion.location.rich_content
                     suggestion.location.rich_content = suggestion.content
+                    record_wiki_revision(suggestion.location, suggestion.content, editor=current_admin,
+                                         source='suggestion', previous_content=previous_content,
+                                         suggestion_id=suggestion.id)
             elif action == 'reject':
                 suggestion.status = 'rejected'
                 suggestion.reject_reason = reason
@@ -822,9 +831,12 @@ def create_location(current_admin):
 def update_location(current_admin, loc_id):
     loc = Location.query.get_or_404(loc_id)
     data = request.get_json()
+    previous_content = loc.rich_content
     for key, value in data.items():
         if hasattr(loc, key):
             setattr(loc, key, value)
+    if 'rich_content' in data:
+        record_wiki_revision(loc, loc.rich_content, editor=current_admin, previous_content=previous_content)
     db.session.commit()
     return jsonify({"message": "Location updated"})
 
@@ -851,8 +863,9 @@ def batch_delete_locations(current_admin):
     
     # 使用 in_() 进行批量更新，效率更高
     try:
+        # 批量 UPDATE 不经过 ORM flush，需要手动分配变更序号供地图增量同步
         deleted_count = Location.query.filter(Location.id.in_(ids)).update(
-            {'deleted_at': datetime.datetime.utcnow()}, 
+            {'deleted_at': datetime.datetime.utcnow(), 'change_seq': next_location_seq()}, 
             synchronize_session=False
         )
         db.session.commit()
@@ -974,6 +987,24 @@ def batch_import_wikis(current_admin, is_admin=False):
     except Exception as e:
         return jsonify({'message': f'文件读取或解析失败: {str(e)}'}), 400
 
+    # --- 新增：预先一次性解析所有行用到的标签，避免逐行逐标签查询 ---
+    def _row_tag_names(item_data):
+        tags_data = item_data.get('tags', [])
+        if isinstance(tags_data, str):
+            tags_data = [t.strip() for t in tags_data.split(',') if t.strip()]
+        return tags_data
+
+    all_tag_names = set()
+    for item_data in wikis_data:
+        if isinstance(item_data, dict) and isinstance(_row_tag_names(item_data), list):
+            for tag_name in _row_tag_names(item_data):
+                try:
+                    if isinstance(tag_name, str):
+                        all_tag_names.add(normalize_tag_name(tag_name))
+                except InvalidTagName:
+                    pass # 过长的名称在处理该行时报错
+    tags_by_name = resolve_tags(all_tag_names)
+
     # 4. 逐条处理数据
     success_count = 0
     failed_count = 0
@@ -1023,7 +1054,11 @@ def batch_import_wikis(current_admin, is_admin=False):
             loc.latitude = latitude
             loc.longitude = longitude
             loc.main_image = item_data.get('mainImage') or item_data.get('main_image')
+            previous_content = loc.rich_content
             loc.rich_content = item_data.get('richContent') or item_data.get('rich_content')
+            if loc.rich_content != previous_content:
+                record_wiki_revision(loc, loc.rich_content, editor=current_admin, source='import',
+                                     previous_content=previous_content)
             
             # 处理 structuredInfo (必须是 JSON 对象)
             s_info = item_data.get('structuredInfo') or item_data.get('structured_info')
@@ -1048,17 +1083,12 @@ def batch_import_wikis(current_admin, is_admin=False):
                 loc.category = category
 
             # f. 处理标签
-            tags_data = item_data.get('tags', [])
-            if isinstance(tags_data, str):
-                tags_data = [t.strip() for t in tags_data.split(',') if t.strip()]
+            tags_data = _row_tag_names(item_data)
             
             if isinstance(tags_data, list):
                 loc.tags.clear()
-                for tag_name in tags_data:
-                    tag = Tag.query.filter_by(name=tag_name).first()
-                    if not tag:
-                        tag = Tag(name=tag_name)
-                        db.session.add(tag)
+                row_tags = [tags_by_name.get(normalize_tag_name(n)) for n in tags_data if isinstance(n, str)]
+                for tag in dict.fromkeys(tag for tag in row_tags if tag is not None):
                     loc.tags.append(tag)
 
             success_count += 1
@@ -1084,6 +1114,92 @@ def batch_import_wikis(current_admin, is_admin=False):
         'message': f'成功处理 {success_count} 条，失败 {failed_count} 条'
     }), 200
 
+# --- 新增：Wiki 修订历史 ---
+@admin_bp.route('/wikis/<int:location_id>/revisions', methods=['GET'])
+@admin_required
+def get_wiki_revisions(current_admin, location_id):
+    """
+    获取地点的修订列表（只返回元数据，不加载正文和增量）。
+    """
+    if current_admin.role not in ['admin', 'wiki_admin']:
+        return jsonify({"message": "权限不足"}), 403
+
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('pageSize', 20, type=int)
+
+    query = WikiRevision.query.options(
+        db.defer(WikiRevision.snapshot),
+        db.defer(WikiRevision.delta)
+    ).filter_by(location_id=location_id).order_by(WikiRevision.revision_number.desc())
+    pagination = query.paginate(page=page, per_page=page_size, error_out=False)
+
+    # 一次查询取出本页涉及的修改者
+    user_ids = {r.user_id for r in pagination.items if r.user_id}
+    admin_ids = {r.admin_id for r in pagination.items if r.admin_id}
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    admins = {a.id: a for a in Admin.query.filter(Admin.id.in_(admin_ids)).all()} if admin_ids else {}
+
+    items = []
+    for r in pagination.items:
+        editor = None
+        if r.admin_id in admins:
+            editor = {"id": r.admin_id, "name": admins[r.admin_id].username, "type": "admin"}
+        elif r.user_id in users:
+            editor = {"id": r.user_id, "name": users[r.user_id].nickname, "type": "user"}
+        items.append({
+            "revision": r.revision_number,
+            "source": r.source,
+            "isSnapshot": r.is_snapshot,
+            "contentLength": r.content_length,
+            "suggestionId": r.suggestion_id,
+            "note": r.note,
+            "editor": editor,
+            "createdAt": r.created_at.isoformat() + 'Z'
+        })
+
+    return jsonify({
+        "items": items,
+        "total": pagination.total,
+        "page": page,
+        "pageSize": page_size
+    })
+
+@admin_bp.route('/wikis/<int:location_id>/revisions/<int:revision_number>', methods=['GET'])
+@admin_required
+def get_wiki_revision_content(current_admin, location_id, revision_number):
+    """重建并返回指定修订的完整正文"""
+    if current_admin.role not in ['admin', 'wiki_admin']:
+        return jsonify({"message": "权限不足"}), 403
+
+    content = reconstruct_revision(location_id, revision_number)
+    if content is None:
+        return jsonify({"message": "修订不存在"}), 404
+    return jsonify({"revision": revision_number, "richContent": content})
+
+@admin_bp.route('/wikis/<int:location_id>/revisions/<int:revision_number>/diff', methods=['GET'])
+@admin_required
+def get_wiki_revision_diff(current_admin, location_id, revision_number):
+    """
+    对比两个修订：默认与上一修订对比，可通过 ?against=<revision> 指定。
+    """
+    if current_admin.role not in ['admin', 'wiki_admin']:
+        return jsonify({"message": "权限不足"}), 403
+
+    against = request.args.get('against', revision_number - 1, type=int)
+    new_content = reconstruct_revision(location_id, revision_number)
+    if new_content is None:
+        return jsonify({"message": "修订不存在"}), 404
+    # 第一个修订没有上一版本，视为与空内容对比
+    old_content = reconstruct_revision(location_id, against) if against >= 1 else ''
+    if old_content is None:
+        return jsonify({"message": f"对比的修订 {against} 不存在"}), 404
+
+    return jsonify({
+        "revision": revision_number,
+        "against": against,
+        "changes": diff_contents(old_content, new_content)
+    })
+
 # --- 修复：导出地点接口 ---
 @admin_bp.route('/locations/export', methods=['GET'])
 @admin_required
@@ -1124,6 +1240,9 @@ def update_system_settings(current_admin):
             setting = SystemSetting(key=key, value=json.dumps(value))
             db.session.add(setting)
     db.session.commit()
+    # 敏感词表在本进程立即生效，其他进程按周期检查
+    if 'sensitive_words' in payload:
+        invalidate_sensitive_words()
     return jsonify({"message": "Settings updated successfully"})
 
 # --- 增强：数据总览接口 ---
@@ -1152,7 +1271,7 @@ def get_analytics_overview(current_admin):
     hotspot_areas = [{"name": name, "visits": visits} for name, visits in hotspot_query]
 
     # --- 核心修复：根据文档要求，精确计算审核统计 ---
-    pending_reviews = Review.query.filter_by(status='pending').count()
+    pending_reviews = Review.query.filter(Review.status.in_(('pending', 'flagged'))).count()
     pending_suggestions = WikiSuggestion.query.filter_by(status='pending').count()
     
     approved_reviews = Review.query.filter_by(status='approved').count()
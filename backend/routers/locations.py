@@ -1,12 +1,21 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from sqlalchemy import func
-from ..models.models import db, Location, Category, Review, Tag, review_tags, WikiSuggestion, LocationView, User
+from ..models.models import db, Location, Category, Review, Tag, review_tags, WikiSuggestion, LocationView, User, LocationTombstone
 from .auth import token_required, wiki_editor_required 
+from ..services.wiki_revisions import record_wiki_revision
+from ..services.location_sync import current_location_seq
+from ..services.sensitive_words import find_sensitive_words
 # --- 新增：导入 datetime ---
 import datetime
 # --- 新增：导入 logging ---
 import logging
 
+# --- 新增：MessagePack 为可选依赖，未安装时只提供 JSON 输出 ---
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 # --- 新增：配置日志记录器 ---
 log = logging.getLogger(__name__)
 
@@ -59,6 +68,8 @@ def create_location_wiki(current_user, is_admin=False):
     # 5. 保存到数据库
     try:
         db.session.add(new_location)
+        if new_location.rich_content:
+            record_wiki_revision(new_location, new_location.rich_content, editor=current_user)
         db.session.commit()
         
         # 6. 返回前端期望的格式
@@ -97,29 +108,39 @@ def get_location_wiki(current_user, location_id): # <-- 核心修改：添加 cu
         Review.rating, 
         func.count(Review.id)
     ).filter(Review.location_id == location_id).group_by(Review.rating).all()
-    
-    # 计算平均分和总数
-    stats = db.session.query(
-        func.avg(Review.rating),
-        func.count(Review.id)
-    ).filter(Review.location_id == location_id).first()
 
-    average_rating = stats[0] or 0
-    reviews_count = stats[1] or 0
+    return jsonify(_serialize_wiki(loc, _build_rating_info(rating_dist)))
+
+def _build_rating_info(rating_dist):
+    """根据 (rating, count) 分布计算平均分、总数和分布，避免再单独执行一次聚合查询"""
+    reviews_count = sum(c for _, c in rating_dist)
+    average_rating = sum(r * c for r, c in rating_dist) / reviews_count if reviews_count else 0
 
     # 聚合数据
-    rating_info = {
+    return {
         "average": float(round(average_rating, 1)), # 确保是 float 类型
         "count": int(reviews_count), # 确保是 int 类型
         "distribution": [{"stars": r, "count": c} for r, c in rating_dist]
     }
 
+def _serialize_wiki(loc, rating_info, categories_by_id=None):
+    """
+    将地点序列化为 Wiki 详情格式。
+    categories_by_id 为预加载的分类字典，提供时不再逐级懒加载父分类。
+    """
     # 构造 categoryPath
     category_path = []
-    cat = loc.category
-    while cat:
-        category_path.insert(0, {"name": cat.name})
-        cat = cat.parent
+    if categories_by_id is not None:
+        cat = categories_by_id.get(loc.category_id)
+        while cat:
+            category_path.insert(0, {"name": cat.name})
+            cat = categories_by_id.get(cat.parent_id)
+    else:
+        cat = loc.category
+        while cat:
+            category_path.insert(0, {"name": cat.name})
+            cat = cat.parent
+    category_name = category_path[-1]["name"] if category_path else None
     
     # 获取 buildingId：优先使用 building_id，其次从 structured_info 获取，最后 fallback 到 wiki_id
     building_id = loc.building_id
@@ -135,13 +156,13 @@ def get_location_wiki(current_user, location_id): # <-- 核心修改：添加 cu
         tag_color = getattr(t, 'color', '#808080') # 默认灰色
         tags_list.append({"id": t.id, "name": t.name, "color": tag_color})
 
-    return jsonify({
+    return {
         "id": loc.id,
         "buildingId": building_id,  # 添加 buildingId 字段
         "name": loc.name,
         "address": loc.address,
         "mainImage": loc.main_image,
-        "category": loc.category.name if loc.category else None,
+        "category": category_name,
         "categoryPath": category_path,
         "richContent": loc.rich_content,
         "structuredInfo": loc.structured_info,
@@ -150,6 +171,55 @@ def get_location_wiki(current_user, location_id): # <-- 核心修改：添加 cu
         "latitude": loc.latitude,
         "longitude": loc.longitude,
         "canEdit": True # 此处应加入真实权限判断逻辑
+    }
+
+# --- 新增：批量获取 Wiki，供地图和"我的收藏"一次性加载多个地点 ---
+MAX_BATCH_WIKI_IDS = 50
+
+@location_bp.route('/wiki/batch', methods=['GET'])
+def get_location_wiki_batch():
+    """
+    批量获取多个地点的 Wiki 信息: /api/location/wiki/batch?ids=1,2,3
+    - 地点、分类、标签和评分统计均以固定次数的查询加载，与 ids 数量无关。
+    - 返回以 id 为键的字典；不存在的 id 放入 missing 列表。
+    - 批量预览不记录地点浏览日志。
+    """
+    raw_ids = request.args.get('ids', '')
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw_ids.split(',') if i.strip()))
+    except ValueError:
+        return jsonify({"message": "ids 必须是以逗号分隔的整数"}), 400
+
+    if not ids:
+        return jsonify({"message": "ids 不能为空"}), 400
+    if len(ids) > MAX_BATCH_WIKI_IDS:
+        return jsonify({"message": f"单次最多查询 {MAX_BATCH_WIKI_IDS} 个地点"}), 400
+
+    # 1. 一次查询加载地点，标签通过 subquery 关系一并加载
+    locations = Location.query.filter(Location.id.in_(ids)).all()
+
+    # 2. 分类表很小，一次加载后在内存中构建 categoryPath
+    categories_by_id = {c.id: c for c in Category.query.all()} if locations else {}
+
+    # 3. 一次分组查询计算所有地点的评分分布
+    rating_rows = db.session.query(
+        Review.location_id,
+        Review.rating,
+        func.count(Review.id)
+    ).filter(Review.location_id.in_(ids)).group_by(Review.location_id, Review.rating).all()
+
+    rating_dist_by_location = {}
+    for loc_id, rating, count in rating_rows:
+        rating_dist_by_location.setdefault(loc_id, []).append((rating, count))
+
+    items = {}
+    for loc in locations:
+        rating_dist = sorted(rating_dist_by_location.get(loc.id, []))
+        items[str(loc.id)] = _serialize_wiki(loc, _build_rating_info(rating_dist), categories_by_id)
+
+    return jsonify({
+        "items": items,
+        "missing": [i for i in ids if str(i) not in items]
     })
 
 # --- ✅ 问题 2 修复：使用新逻辑完整替换 update_location_wiki 函数 ---
@@ -200,6 +270,7 @@ def update_location_wiki(current_admin, location_id, is_admin=False):
             return jsonify({'success': False, 'message': '地点不存在'}), 404
 
         # 4. 更新数据库字段 (处理 camelCase 到 snake_case 的映射)
+        previous_content = location.rich_content
         location.name = data.get('name')
         location.address = data.get('address')
         location.latitude = latitude
@@ -229,6 +300,9 @@ def update_location_wiki(current_admin, location_id, is_admin=False):
         # 更新修改时间
         location.updated_at = datetime.datetime.utcnow()
 
+        # 记录正文修订历史
+        record_wiki_revision(location, location.rich_content, editor=current_admin, previous_content=previous_content)
+
         # 5. 提交到数据库
         db.session.commit()
 
@@ -320,6 +394,10 @@ def submit_wiki_suggestion(current_user=None):
             user_id=user_id,
             status='pending'
         )
+        # --- 新增：标注命中的敏感词，供审核人员参考 ---
+        sensitive = find_sensitive_words(content)
+        if sensitive:
+            suggestion.reviewer_note = f"[敏感词] {'、'.join(sorted({word for _, _, word in sensitive}))}"
         db.session.add(suggestion)
         db.session.commit()
 
@@ -370,50 +448,182 @@ def get_map_buildings():
     """
     获取所有已发布的、带有地理位置信息的建筑，用于地图展示。
     严格遵循 MAP_BUILDINGS_API.md 文档规范。
+    - ?format=columnar 返回紧凑的列式数据，详情仍通过 Wiki 接口获取。
+    - ?since=<seq> 只返回该序号之后新增/修改/移除的建筑，响应中的 seq 用于下次同步。
     """
+    since = request.args.get('since', type=int)
+    if since is not None and since > 0:
+        return _get_map_buildings_since(since)
+
+    if request.args.get('format') == 'columnar':
+        return _get_map_buildings_columnar()
+
     try:
-        # 1. 查询所有已发布的、且包含有效经纬度的地点
-        #    - 使用 dedicated latitude/longitude 字段进行高效查询
-        #    - 预加载 category 关系以避免 N+1 查询
-        locations = Location.query.options(
+        return jsonify(_map_buildings_payload())
+
+    except Exception as e:
+        log.error(f"[地图建筑数据] 获取失败: {str(e)}", exc_info=True)
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e)
+        }), 500
+
+def _map_buildings_payload():
+    # 先读取序号，之后提交的变更会在下次增量同步中返回
+    seq = current_location_seq()
+
+    # 1. 查询所有已发布的、且包含有效经纬度的地点
+    #    - 使用 dedicated latitude/longitude 字段进行高效查询
+    #    - 预加载 category 关系以避免 N+1 查询
+    locations = Location.query.options(
+        db.joinedload(Location.category)
+    ).filter(
+        Location.status == 'published',
+        Location.deleted_at.is_(None),
+        Location.latitude.isnot(None),
+        Location.longitude.isnot(None)
+    ).all()
+
+    buildings = [_serialize_map_building(loc) for loc in locations]
+    return {
+        'buildings': buildings,
+        'total': len(buildings),
+        'seq': seq
+    }
+
+def _serialize_map_building(loc):
+    # 2. 安全地从 structured_info 获取附加信息
+    structured_info = loc.structured_info or {}
+    
+    # 3. 按照文档格式构建每个建筑的数据
+    return {
+        'id': loc.building_id or loc.id,
+        'name': loc.name,
+        'type': loc.category.name if loc.category else '其他',
+        'position': [loc.longitude, loc.latitude], # 格式: [经度, 纬度]
+        'description': (loc.rich_content or loc.address or '')[:100], # 简短描述
+        'openTime': structured_info.get('openTime', ''),
+        'address': loc.address or '',
+        'phone': structured_info.get('phone', ''),
+        'facilities': structured_info.get('facilities', []),
+        'mainImage': loc.main_image,
+        'wikiId': loc.id,
+    }
+
+def _get_map_buildings_since(since):
+    """
+    增量同步：返回 change_seq > since 的地点。
+    - buildings：仍应显示在地图上的新增或修改建筑；
+    - removed：被删除、软删除、下线或失去坐标的建筑 ID (building id)。
+    since 大于服务器当前序号时（例如数据库被重置），返回 reset=true 的全量数据。
+    """
+    try:
+        seq = current_location_seq()
+        if since > seq:
+            response = _map_buildings_payload()
+            response['reset'] = True
+            return jsonify(response)
+
+        changed = Location.query.options(
             db.joinedload(Location.category)
         ).filter(
-            Location.status == 'published',
-            Location.latitude.isnot(None),
-            Location.longitude.isnot(None)
+            Location.change_seq > since
         ).all()
-        
+
         buildings = []
-        for loc in locations:
-            # 2. 安全地从 structured_info 获取附加信息
-            structured_info = loc.structured_info or {}
-            
-            # 3. 按照文档格式构建每个建筑的数据
-            building_data = {
-                'id': loc.building_id or loc.id,
-                'name': loc.name,
-                'type': loc.category.name if loc.category else '其他',
-                'position': [loc.longitude, loc.latitude], # 格式: [经度, 纬度]
-                'description': (loc.rich_content or loc.address or '')[:100], # 简短描述
-                'openTime': structured_info.get('openTime', ''),
-                'address': loc.address or '',
-                'phone': structured_info.get('phone', ''),
-                'facilities': structured_info.get('facilities', []),
-                'mainImage': loc.main_image,
-                'wikiId': loc.id,
-            }
-            buildings.append(building_data)
-        
-        # 4. 返回最终的 JSON 响应
+        removed = []
+        for loc in changed:
+            visible = loc.status == 'published' and loc.deleted_at is None and \
+                loc.latitude is not None and loc.longitude is not None
+            if visible:
+                buildings.append(_serialize_map_building(loc))
+            else:
+                removed.append(loc.building_id or loc.id)
+
+        tombstones = db.session.query(
+            LocationTombstone.location_id, LocationTombstone.building_id
+        ).filter(LocationTombstone.change_seq > since).all()
+        removed.extend(building_id or location_id for location_id, building_id in tombstones)
+
         return jsonify({
             'buildings': buildings,
-            'total': len(buildings)
+            'removed': removed,
+            'total': len(buildings),
+            'seq': seq
         })
 
     except Exception as e:
-        log.error(f"[地图建筑数据] 获取失败: {str(e)}", exc_info=True)
+        log.error(f"[地图建筑数据] 增量同步失败: {str(e)}", exc_info=True)
+        return jsonify({
+            "error": "Internal server error",
+            "message": str(e)
+        }), 500
+
+def _get_map_buildings_columnar():
+    """
+    列式地图数据：每个字段一个数组，按下标对应同一建筑。
+    - types 为 categories 字典中的下标；
+    - positions 为扁平数组 [lng0, lat0, lng1, lat1, ...]，保留 6 位小数；
+    - ?encoding=msgpack（或 Accept: application/x-msgpack）时以 MessagePack 编码返回。
+    """
+    try:
+        seq = current_location_seq()
+
+        # 只查询地图标记需要的列，不加载正文和结构化信息
+        rows = db.session.query(
+            Location.id,
+            Location.building_id,
+            Location.name,
+            Location.longitude,
+            Location.latitude,
+            Category.name
+        ).outerjoin(
+            Category, Location.category_id == Category.id
+        ).filter(
+            Location.status == 'published',
+            Location.deleted_at.is_(None),
+            Location.latitude.isnot(None),
+            Location.longitude.isnot(None)
+        ).order_by(Location.id).all()
+
+        categories = []
+        category_index = {}
+        ids, wiki_ids, names, types, positions = [], [], [], [], []
+        for loc_id, building_id, name, longitude, latitude, category_name in rows:
+            category_name = category_name or '其他'
+            if category_name not in category_index:
+                category_index[category_name] = len(categories)
+                categories.append(category_name)
+
+            ids.append(building_id or loc_id)
+            wiki_ids.append(loc_id)
+            names.append(name)
+            types.append(category_index[category_name])
+            positions.extend((round(longitude, 6), round(latitude, 6)))
+
+        payload = {
+            'format': 'columnar',
+            'total': len(ids),
+            'seq': seq,
+            'categories': categories,
+            'ids': ids,
+            'wikiIds': wiki_ids,
+            'names': names,
+            'types': types,
+            'positions': positions
+        }
+    except Exception as e:
+        log.error(f"[地图建筑数据] 列式数据获取失败: {str(e)}", exc_info=True)
         return jsonify({
             "error": "Internal server error",
             "message": str(e)
         }), 500
-    
\ No newline at end of file
+
+    wants_msgpack = request.args.get('encoding') == 'msgpack' or \
+        request.accept_mimetypes.best == 'application/x-msgpack'
+    if wants_msgpack:
+        if msgpack is None:
+            return jsonify({"error": "Not acceptable", "message": "服务器未启用 MessagePack 编码"}), 406
+        return Response(msgpack.packb(payload, use_bin_type=True), mimetype='application/x-msgpack')
+
+    return jsonify(payload)
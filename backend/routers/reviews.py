@@ -1,39 +1,158 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from sqlalchemy.exc import IntegrityError
-from ..models.models import db, Review, Location, ReviewLike, ReviewReply, ReviewReport, Message, Tag, review_tags, UserLog, ReviewReplyReport
+from ..models.models import db, Review, Location, ReviewLike, ReviewReply, ReviewReport, Tag, review_tags, UserLog, ReviewReplyReport, ImageAsset
 from .auth import token_required
-import os
-import uuid
+from ..services.pagination import paginate_keyset, clamp_page_size, encode_cursor, InvalidCursor
+from ..services.review_counters import bump_review_counters, compute_hot_score, compute_top_score
+from ..services.notifications import notify
+from ..services.review_likes import add_review_like, remove_review_like
+from ..services.tags import resolve_tags
+from ..services.near_duplicates import check_review, check_reply, remember_review, remember_reply, to_signed
+from ..services.sensitive_words import find_sensitive_words, mask_sensitive_words
+from ..services.image_pipeline import probe_image, schedule_image_processing, build_image_set
+from ..services.uploads import upload_limits
+from ..services.image_store import store_image, add_review_ref, blob_disk_path, blob_web_folder
 from werkzeug.utils import secure_filename
 # --- 新增：导入 timezone ---
 from datetime import timezone
+import datetime
 
 # --- 导入 users.py 中的日志函数 ---
 from .users import log_user_action
 
 reviews_bp = Blueprint('reviews_api', __name__, url_prefix='/api/reviews')
 
+# --- 新增：评论列表排序方式 ---
+REVIEW_SORT_COLUMNS = {
+    'new': Review.created_at,
+    'hot': Review.hot_score,
+    'top': Review.top_score
+}
+
 @reviews_bp.route('', methods=['GET'])
-def get_location_comments():
-    """获取评论列表（支持标签筛选）"""
+@token_required(optional=True)
+def get_location_comments(current_user):
+    """
+    获取评论列表（支持标签筛选）
+    - 传入 cursor 参数（首页传空字符串）时按 (排序分数, id) 游标分页，不执行 COUNT(*) 和 OFFSET 扫描，
+      是否还有下一页由多取一条判断 (hasMore)；需要总数时传 withTotal=1（只在首页统计）；
+    - 否则沿用 page/pageSize 分页。
+    - sort: new（默认，按时间）、hot（热度，随时间衰减）、top（总互动量），
+      分数已预先计算并建有索引，查询时不做计算。
+    - replyPreview: 每条评论内嵌的最早几条回复（默认 3，最多 10），
+      更多回复用 repliesNextCursor 调用回复列表接口加载。
+    - 携带登录 token 时，每条评论返回 likedByMe。
+    """
     location_id = request.args.get('locationId', type=int)
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('pageSize', 10, type=int)
     tag_filter = request.args.get('tag') # 标签筛选
+    sort = request.args.get('sort', 'new')
+    # 每条评论内嵌的回复数量，其余回复通过 /<review_id>/replies 分页加载
+    reply_preview = min(max(request.args.get('replyPreview', REPLY_PREVIEW_SIZE, type=int), 0), MAX_REPLY_PREVIEW_SIZE)
     
     if not location_id:
         return jsonify({"message": "locationId is required"}), 400
+    if sort not in REVIEW_SORT_COLUMNS:
+        return jsonify({"message": "sort 只支持 hot、top、new"}), 400
+    sort_col = REVIEW_SORT_COLUMNS[sort]
         
-    query = Review.query.filter_by(location_id=location_id)
+    # 疑似重复、等待人工复核的评论不公开展示
+    query = Review.query.filter(Review.location_id == location_id, Review.status != 'flagged')
 
     # 如果有标签筛选
     if tag_filter:
         query = query.join(review_tags).join(Tag).filter(Tag.name == tag_filter)
     
-    query = query.order_by(Review.created_at.desc())
+    # 作者用 JOIN、标签用 IN 一次性加载，避免逐条评论懒加载
+    query = query.options(
+        db.joinedload(Review.author),
+        db.selectinload(Review.tags)
+    )
+
+    if 'cursor' in request.args:
+        cursor = request.args.get('cursor')
+        page_size = clamp_page_size(page_size)
+        # 总数按需统计，且只在首页统计一次，翻页时由客户端沿用
+        with_total = request.args.get('withTotal', 0, type=int)
+        total = query.order_by(None).count() if with_total and not cursor else None
+        try:
+            reviews, next_cursor = paginate_keyset(query, sort_col, Review.id, cursor, page_size)
+        except InvalidCursor as e:
+            return jsonify({"message": str(e)}), 400
+
+        return jsonify({
+            "items": _serialize_reviews(reviews, reply_preview, viewer=current_user),
+            "nextCursor": next_cursor,
+            "hasMore": next_cursor is not None,
+            "total": total,
+            "pageSize": page_size
+        }), 200
+
+    query = query.order_by(sort_col.desc(), Review.id.desc())
     pagination = query.paginate(page=page, per_page=page_size, error_out=False)
-    reviews = pagination.items
-    
+
+    return jsonify({
+        "items": _serialize_reviews(pagination.items, reply_preview, viewer=current_user),
+        "total": pagination.total,
+        "page": pagination.page,
+        "pageSize": pagination.per_page,
+        "pages": pagination.pages
+    }), 200
+
+# --- 新增：评论列表中每条评论内嵌的回复数量 ---
+REPLY_PREVIEW_SIZE = 3
+MAX_REPLY_PREVIEW_SIZE = 10
+
+def _serialize_reply(reply):
+    return {
+        "id": reply.id,
+        "userId": reply.author.id,
+        "userName": reply.author.nickname,
+        "userAvatar": reply.author.avatar_url,
+        "content": reply.content,
+        "createdAt": reply.created_at.isoformat() + 'Z'
+    }
+
+def _serialize_reviews(reviews, reply_preview=REPLY_PREVIEW_SIZE, viewer=None):
+    """序列化一页评论，回复预览、图片信息和当前用户的点赞状态按整页批量查询"""
+    review_ids = [r.id for r in reviews]
+
+    # 当前用户在本页点过赞的评论一次查询取出
+    liked_ids = set()
+    if viewer is not None and review_ids:
+        liked_ids = {rid for (rid,) in db.session.query(ReviewLike.review_id).filter(
+            ReviewLike.user_id == viewer.id,
+            ReviewLike.review_id.in_(review_ids)
+        )}
+
+    # 本页所有图片的尺寸和变体信息一次查询取出
+    image_paths = {img for r in reviews if isinstance(r.images, list) for img in r.images}
+    assets = {}
+    if image_paths:
+        assets = {a.path: a for a in ImageAsset.query.filter(ImageAsset.path.in_(image_paths)).all()}
+
+    # 本页每条评论的前 reply_preview 条回复（连同回复作者）用窗口函数一次查询取出，
+    # 其余回复通过 GET /<review_id>/replies 分页加载
+    replies_by_review = {}
+    if review_ids and reply_preview > 0:
+        row_number = db.func.row_number().over(
+            partition_by=ReviewReply.review_id,
+            order_by=(ReviewReply.created_at.asc(), ReviewReply.id.asc())
+        ).label('rn')
+        ranked = db.select(ReviewReply.id, row_number).where(
+            ReviewReply.review_id.in_(review_ids)
+        ).subquery()
+        replies = ReviewReply.query.options(
+            db.joinedload(ReviewReply.author)
+        ).join(
+            ranked, ranked.c.id == ReviewReply.id
+        ).filter(
+            ranked.c.rn <= reply_preview
+        ).order_by(ReviewReply.created_at.asc(), ReviewReply.id.asc()).all()
+        for reply in replies:
+            replies_by_review.setdefault(reply.review_id, []).append(reply)
+
     base_url = request.url_root.rstrip('/')
 
     items = []
@@ -42,18 +161,13 @@ def get_location_comments():
         if isinstance(r.images, list):
             # image_urls = [f"{base_url}{img}" if img.startswith('/') else img for img in r.images]
             image_urls = [f"{img}" if img.startswith('/') else img for img in r.images]
-        # 获取该评论的回复
-        replies = r.replies.order_by(ReviewReply.created_at.asc()).all()
-        reply_list = []
-        for reply in replies:
-            reply_list.append({
-                "id": reply.id,
-                "userId": reply.author.id,
-                "userName": reply.author.nickname,
-                "userAvatar": reply.author.avatar_url,
-                "content": reply.content,
-                "createdAt": reply.created_at.isoformat() + 'Z'
-            })
+        # 获取该评论的回复预览，还有更多回复时给出继续加载的游标
+        replies = replies_by_review.get(r.id, [])
+        reply_list = [_serialize_reply(reply) for reply in replies]
+        replies_next_cursor = None
+        if r.reply_count > len(replies):
+            last = replies[-1] if replies else None
+            replies_next_cursor = encode_cursor('created_at', last.created_at, last.id) if last else ''
 
         items.append({
             "id": r.id,
@@ -64,25 +178,51 @@ def get_location_comments():
             "rating": r.rating,
             "comment": r.comment,
             "images": image_urls,
+            "imageSet": [build_image_set(url, assets.get(url)) for url in image_urls],
             "createdAt": r.created_at.isoformat() + 'Z',
             "updatedAt": r.updated_at.isoformat() + 'Z',
-            "likes": r.likes.count(),
+            "likes": r.like_count,
+            "likedByMe": r.id in liked_ids,
             "tags": [t.name for t in r.tags], # 添加标签
-            "replyCount": len(replies),
-            "replies": reply_list
+            "replyCount": r.reply_count,
+            "replies": reply_list,
+            "repliesNextCursor": replies_next_cursor
         })
+    return items
+
+# --- 新增：游标分页获取某条评论的回复 ---
+@reviews_bp.route('/<int:review_id>/replies', methods=['GET'])
+def get_review_replies(review_id):
+    """
+    按 (created_at, id) 升序游标分页获取回复。
+    首页不传 cursor，之后传入上一页返回的 nextCursor。
+    """
+    page_size = clamp_page_size(request.args.get('pageSize', 20, type=int), default=20)
+    cursor = request.args.get('cursor')
+
+    query = ReviewReply.query.options(
+        db.joinedload(ReviewReply.author)
+    ).filter(ReviewReply.review_id == review_id)
+    try:
+        replies, next_cursor = paginate_keyset(
+            query, ReviewReply.created_at, ReviewReply.id, cursor, page_size, descending=False
+        )
+    except InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
 
     return jsonify({
-        "items": items,
-        "total": pagination.total,
-        "page": pagination.page,
-        "pageSize": pagination.per_page,
-        "pages": pagination.pages
+        "items": [_serialize_reply(reply) for reply in replies],
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "pageSize": page_size
     }), 200
 
 # --- 允许的图片扩展名 ---
 REVIEWS_SUBFOLDER = 'reviews'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# --- 新增：单张图片大小和数量限制，与前端保持一致 ---
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_REVIEW_IMAGES = 9
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -90,6 +230,7 @@ def allowed_file(filename):
 
 @reviews_bp.route('', methods=['POST'])
 @token_required
+@upload_limits(MAX_IMAGE_SIZE, max_files=MAX_REVIEW_IMAGES, allowed_extensions=ALLOWED_EXTENSIONS)
 def submit_review(current_user):
     # --- 核心修改：从 request.form 和 request.files 获取数据 ---
     # data = request.get_json()  <-- 不再使用这个
@@ -110,55 +251,73 @@ def submit_review(current_user):
     # 检查地点是否存在
     if not Location.query.get(location_id):
         return jsonify({"message": "Location not found"}), 404
+
+    # --- 新增：近似重复检测，在保存图片之前进行 ---
+    simhash, own_duplicate, similar_review = check_review(comment, current_user.id, location_id)
+    if own_duplicate:
+        return jsonify({"message": "你最近发布过内容相似的评论，请勿重复发布"}), 409
         
     image_paths = []
+    image_assets = []
+    new_assets = [] # 首次出现的图片，提交后交给后台处理
     for file in uploaded_files:
         if file and allowed_file(file.filename):
-            # 生成安全且唯一的文件名
-            filename = secure_filename(file.filename)
-            ext = filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{ext}"
-            
-            # --- 核心修改：构建正确的保存路径 ---
-            # 确保子文件夹存在
-            upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], REVIEWS_SUBFOLDER)
-            os.makedirs(upload_path, exist_ok=True)
-            save_path = os.path.join(upload_path, unique_filename)
-            
-            # 保存文件
-            file.save(save_path)
-            
-            # --- 核心修改：存储可供 Web 访问的相对路径 ---
-            web_path = f"/uploads/{REVIEWS_SUBFOLDER}/{unique_filename}".replace('\\', '/')
-            image_paths.append(web_path)
+            # 只读取文件头校验是否为图片，完整解码在后台进行
+            if not probe_image(file.stream):
+                continue
+
+            ext = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+            # 按内容哈希保存，重复上传的图片直接复用已有文件
+            asset, created = store_image(file.stream, ext)
+            image_paths.append(asset.path)
+            image_assets.append(asset)
+            if created:
+                new_assets.append(asset)
+    created_at = datetime.datetime.utcnow()
     new_review = Review(
         user_id=current_user.id,
         location_id=location_id,
         rating=rating,
         comment=comment,
         # 存储图片路径列表
-        images=image_paths
+        images=image_paths,
+        created_at=created_at,
+        hot_score=compute_hot_score(0, created_at),
+        top_score=compute_top_score(0, created_at),
+        simhash=to_signed(simhash)
     )
+    # 与同一地点其他用户的评论高度相似，标记为 flagged，审核通过前不在列表中展示
+    if similar_review:
+        new_review.status = 'flagged'
+        new_review.reviewer_note = f"[疑似重复] 与评论 #{similar_review} 内容相似"
+    # --- 新增：评论与回复一样直接展示，敏感词替换为 *，备注命中的词供审核人员参考 ---
+    sensitive = find_sensitive_words(comment)
+    if sensitive:
+        new_review.comment = mask_sensitive_words(comment, sensitive)
+        words = '、'.join(sorted({word for _, _, word in sensitive}))
+        note = f"[敏感词] {words}"
+        new_review.reviewer_note = f"{new_review.reviewer_note}\n{note}" if new_review.reviewer_note else note
 
     # --- 处理标签 ---
     if tags:
-        for tag_name in set(tags): # 使用 set 去重
-            tag_name = tag_name.strip()
-            if not tag_name or len(tag_name) > 10:
-                continue
-            
-            # 查找或创建标签
-            tag = Tag.query.filter_by(name=tag_name).first()
-            if not tag:
-                tag = Tag(name=tag_name)
-                db.session.add(tag)
-            
-            # 添加关联
+        tag_names = {name.strip() for name in tags} # 使用 set 去重
+        tag_names = {name for name in tag_names if name and len(name) <= 10}
+        # 一次性查找或创建所有标签；只有大小写不同的名称对应同一个标签，需去重
+        for tag in dict.fromkeys(resolve_tags(tag_names).values()):
             new_review.tags.append(tag)
 
     db.session.add(new_review)
+    db.session.flush()
+    for asset in image_assets:
+        add_review_ref(asset, new_review.id)
     log_user_action(current_user, 'SUBMIT_REVIEW', detail={"review_id": new_review.id, "location_id": location_id})
     db.session.commit()
+
+    remember_review(new_review)
+
+    # 原图已保存，缩放和去除 EXIF 交给后台进程池，不阻塞请求
+    for asset in new_assets:
+        schedule_image_processing(asset, blob_disk_path(asset), blob_web_folder(asset))
     
     return jsonify({
         "success": True,
@@ -193,23 +352,15 @@ def report_review(current_user, review_id):
             reason=reason
         )
         db.session.add(new_report)
-
-        # --- 新增：发送被举报通知给评论作者 ---
-        notification = Message(
-            user_id=review.user_id,
-            type='report', # 或 'report'
-            content="你的一条评论被举报，我们将会尽快审核。",
-            link=f"/locations/{review.location_id}?reviewId={review.id}",
-            related_review_id=review.id,
-            related_comment=review.comment[:100]
-        )
-        db.session.add(notification)
         log_user_action(current_user, 'REPORT_REVIEW', detail={"review_id": review_id})
         db.session.commit()
     except IntegrityError:
         db.session.rollback()
         return jsonify({"message": "你已经举报过这条评论"}), 409
 
+    # --- 新增：发送被举报通知给评论作者（后台合并发送）---
+    notify(review.user_id, 'report', review, current_user)
+
     return jsonify({
         "success": True,
         "message": "举报成功，我们将会尽快处理"
@@ -235,34 +386,32 @@ def add_reply(current_user, review_id):
     
     if len(content) > 500:
         return jsonify({"message": "回复内容不能超过500字"}), 400
+
+    # --- 新增：同一用户短时间内发布相似回复视为刷屏 ---
+    simhash, own_duplicate = check_reply(content, current_user.id, review_id)
+    if own_duplicate:
+        return jsonify({"message": "你最近发布过内容相似的回复，请勿重复发布"}), 409
     
+    # --- 新增：回复不经审核直接展示，敏感词替换为 * ---
+    content = mask_sensitive_words(content)
+
     # 创建回复
     new_reply = ReviewReply(
         review_id=review_id,
         user_id=current_user.id,
-        content=content
+        content=content,
+        simhash=to_signed(simhash)
     )
     
     db.session.add(new_reply)
+    bump_review_counters(review_id, replies=1, created_at=review.created_at)
 
-    # --- 新增：发送消息通知 ---
-    # 只有当回复者不是评论作者本人时才发送通知
-    if review.user_id != current_user.id:
-        notification_content = f"你的评论收到了来自 {current_user.nickname} 的一条新回复"
-        # 创建一个链接，前端可以点击跳转到对应的评论区
-        notification_link = f"/locations/{review.location_id}?reviewId={review.id}"
-        
-        notification = Message(
-            user_id=review.user_id,
-            type='reply',
-            content=notification_content,
-            link=notification_link,
-            related_review_id=review.id,
-            related_comment=review.comment[:100]
-        )
-        db.session.add(notification)
     log_user_action(current_user, 'ADD_REVIEW_REPLY', detail={"review_id": review_id, "reply_id": new_reply.id})
     db.session.commit()
+    remember_reply(new_reply)
+
+    # --- 新增：发送消息通知（后台合并发送，回复者是评论作者本人时忽略）---
+    notify(review.user_id, 'reply', review, current_user)
     
     # --- 核心修复：正确处理 UTC 时间转换 ---
     # 1. 假设从数据库获取的 created_at 是一个 naive datetime (代表UTC时间)
@@ -323,6 +472,27 @@ def report_review_reply(current_user, reply_id):
         "message": "举报成功，我们将会尽快处理"
     }), 201
 
+def _apply_like(current_user, review, liked):
+    """
+    将点赞状态设为 liked 并提交，返回 (是否发生变化, 最新计数)。
+    点赞记录和计数在同一事务内通过单条语句写入；状态未变化时不更新计数。
+    """
+    if liked:
+        changed = add_review_like(current_user.id, review)
+    else:
+        changed = remove_review_like(current_user.id, review)
+    like_delta = (1 if liked else -1) if changed else 0
+    # 新计数由已加载的值推算，无需再查询
+    current_likes_count = max((review.like_count or 0) + like_delta, 0)
+    if changed:
+        log_user_action(current_user, 'TOGGLE_LIKE_REVIEW', detail={"review_id": review.id, "liked": liked})
+    db.session.commit()
+
+    # --- 新增：点赞通知由后台合并发送，窗口内先赞后取消不会产生消息 ---
+    if changed:
+        notify(review.user_id, 'like', review, current_user, delta=like_delta)
+    return changed, current_likes_count
+
 # --- 新增：点赞评论的路由 ---
 @reviews_bp.route('/<int:review_id>/like', methods=['POST'])
 @token_required
@@ -334,47 +504,38 @@ def toggle_like_review(current_user, review_id):
     
     if not review:
         return jsonify({"message": "Review not found"}), 404
-        
-    # 查找用户是否已经点过赞
-    existing_like = ReviewLike.query.filter_by(
-        user_id=current_user.id,
-        review_id=review.id
-    ).first()
-    
-    if existing_like:
-        # --- 如果已点赞，则取消点赞 ---
-        db.session.delete(existing_like)
-        message = "Review unliked successfully"
-        liked = False
-    else:
-        # --- 如果未点赞，则添加点赞 ---
-        new_like = ReviewLike(user_id=current_user.id, review_id=review.id)
-        db.session.add(new_like)
-        message = "Review liked successfully"
-        liked = True
 
-        # --- 新增：发送点赞通知 ---
-        # 仅当点赞者不是评论作者本人时发送
-        if review.user_id != current_user.id:
-            notification = Message(
-                user_id=review.user_id,
-                type='like',
-                content=f"你的评论收到了来自 {current_user.nickname} 的一个赞",
-                link=f"/locations/{review.location_id}?reviewId={review.id}",
-                related_review_id=review.id,
-                related_comment=review.comment[:100] # 截取前100字作为快照
-            )
-            db.session.add(notification)
-        
-    log_user_action(current_user, 'TOGGLE_LIKE_REVIEW', detail={"review_id": review_id, "liked": liked})
-    db.session.commit()
-    
-    # --- 核心修复：在 commit 后，通过关系查询最新的点赞总数 ---
-    current_likes_count = review.likes.count()
+    # 先尝试取消点赞，没有可删除的记录时再点赞，无需先查询点赞状态
+    changed, current_likes_count = _apply_like(current_user, review, False)
+    liked = False
+    if not changed:
+        _, current_likes_count = _apply_like(current_user, review, True)
+        liked = True
     
     return jsonify({
         "success": True,
-        "message": message,
+        "message": "Review liked successfully" if liked else "Review unliked successfully",
         "liked": liked,
         "likes": current_likes_count # 返回最新的计数值
     }), 200
+
+# --- 新增：幂等的点赞 / 取消点赞接口，重复请求不会改变结果 ---
+@reviews_bp.route('/<int:review_id>/like', methods=['PUT', 'DELETE'])
+@token_required
+def set_like_review(current_user, review_id):
+    """
+    PUT 点赞，DELETE 取消点赞。
+    """
+    review = Review.query.get(review_id)
+    if not review:
+        return jsonify({"message": "Review not found"}), 404
+
+    liked = request.method == 'PUT'
+    changed, current_likes_count = _apply_like(current_user, review, liked)
+    return jsonify({
+        "success": True,
+        "message": "Review liked successfully" if liked else "Review unliked successfully",
+        "liked": liked,
+        "changed": changed,
+        "likes": current_likes_count
+    }), 200
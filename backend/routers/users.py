@@ -1,32 +1,56 @@
-from flask import Blueprint, request, jsonify, current_app
-from ..models.models import db, User, Favorite, History, Message, Review, Location, UserLog, UserLoginLog, ReviewReply
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from ..models.models import db, User, Favorite, History, Message, Review, Location, UserLoginLog, ReviewReply
 # 导入真实的认证模块
 from .auth import create_token, token_required
+from ..services.uploads import upload_limits
+from ..services.image_store import store_image, replace_avatar_ref, BLOB_SUBFOLDER
+from ..services.sensitive_words import find_sensitive_words
+from ..services.message_counters import bump_unread_count
+from ..services.audit_log import record_audit_event
+from ..services.passwords import hash_password, verify_password, needs_rehash, PasswordHashBusy
+from ..services.login_throttle import check_login_attempt, reset_login_attempts
+from ..services.message_stream import (
+    subscribe, unsubscribe, stream_events, snapshot_events, publish_unread_count, missed_messages, message_payload,
+    TooManyConnections, DEFAULT_MAX_CONNECTIONS, DEFAULT_MAX_SECONDS
+)
+from ..services.pagination import paginate_keyset, clamp_page_size, encode_cursor, decode_cursor, InvalidCursor
+from sqlalchemy import select, union_all, literal, null, or_, and_
+from sqlalchemy.orm import aliased
 import datetime
 # --- 新增：导入缺失的模块 ---
 import os
-from werkzeug.utils import secure_filename
 from datetime import timezone
 
 user_bp = Blueprint('user_api', __name__, url_prefix='/api/user')
 
 # --- 新增：日志记录辅助函数 ---
 def log_user_action(user, action, detail=None):
-    """记录用户操作日志的辅助函数"""
+    """记录用户操作日志的辅助函数（随当前事务提交后异步批量写入）"""
     try:
-        log = UserLog(
+        record_audit_event(
             user_id=user.id,
             action=action,
             detail=str(detail) if detail else None,
             ip=request.remote_addr,
             user_agent=request.user_agent.string
         )
-        db.session.add(log)
         # 注意：这里不 commit，由调用它的主函数统一 commit
     except Exception as e:
         # 即使日志记录失败，也不应中断主流程
         print(f"Error logging user action: {e}")
 
+def _too_many_attempts(wait):
+    response = jsonify({"message": "尝试次数过多，请稍后再试"})
+    response.headers['Retry-After'] = str(int(wait) + 1)
+    return response, 429
+
+
+def _hash_busy():
+    response = jsonify({"message": "服务繁忙，请稍后再试"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
 @user_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -34,11 +58,18 @@ def register():
     password = data.get('password')
     if not phone or not password:
         return jsonify({"message": "Phone and password are required"}), 400
+    # --- 新增：按 IP 限流，在计算密码哈希之前拒绝 ---
+    wait = check_login_attempt(None, request.remote_addr)
+    if wait:
+        return _too_many_attempts(wait)
     if User.query.filter_by(phone=phone).first():
         return jsonify({"message": "Phone number already registered"}), 409
     
     new_user = User(phone=phone, nickname=data.get('nickname') or f'user_{phone[-4:]}')
-    new_user.set_password(password)
+    try:
+        new_user.password_hash = hash_password(password)
+    except PasswordHashBusy:
+        return _hash_busy()
     db.session.add(new_user)
     # --- 核心修复：在这里刷入会话以获取 new_user.id ---
     db.session.flush()
@@ -49,8 +80,24 @@ def register():
 @user_bp.route('/login', methods=['POST'])
 def login():
     data = request.get_json()
+    # --- 新增：按手机号和 IP 限流，在查询用户和计算密码哈希之前拒绝 ---
+    wait = check_login_attempt(data.get('phone'), request.remote_addr)
+    if wait:
+        return _too_many_attempts(wait)
+
     user = User.query.filter_by(phone=data.get('phone')).first()
-    if user and user.check_password(data.get('password')):
+    try:
+        verified = user is not None and verify_password(user.password_hash, data.get('password'))
+    except PasswordHashBusy:
+        return _hash_busy()
+    if verified:
+        reset_login_attempts(data.get('phone'))
+        # 哈希参数已调整时，用本次提交的明文密码重新计算，随登录日志一起提交
+        if needs_rehash(user.password_hash):
+            try:
+                user.password_hash = hash_password(data.get('password'))
+            except PasswordHashBusy:
+                pass # 下次登录时再重新计算
         # 使用 auth.py 中的函数生成 JWT 和过期时间
         token, expires_in = create_token(user.id)
         if user.status != 'banned': 
@@ -109,11 +156,13 @@ def allowed_file(filename):
 
 @user_bp.route('/profile', methods=['PUT'])
 @token_required
+@upload_limits(MAX_FILE_SIZE, allowed_extensions=ALLOWED_EXTENSIONS)
 def update_profile(current_user):
     """
     更新用户资料，支持头像上传 (multipart/form-data) 和纯文本更新 (json)
     """
     avatar_url = current_user.avatar_url
+    avatar_asset = None
     
     # 1. 检查是否有文件上传 (multipart/form-data)
     if 'avatar' in request.files:
@@ -126,24 +175,10 @@ def update_profile(current_user):
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'message': '只支持图片格式（jpg, png, gif, webp）'}), 415
         
-        # 检查文件大小 (通过读取内容长度)
-        if len(file.read()) > MAX_FILE_SIZE:
-            return jsonify({'success': False, 'message': '文件大小不能超过 2MB'}), 413
-        file.seek(0) # 重置文件指针
-        
-        # 生成唯一文件名
-        timestamp = int(datetime.datetime.now().timestamp())
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = secure_filename(f"user{current_user.id}_{timestamp}.{ext}")
-        
-        # 确保上传目录存在
-        # 使用 current_app 获取全局配置
-        upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], AVATAR_SUBFOLDER)
-        os.makedirs(upload_path, exist_ok=True)
-        filepath = os.path.join(upload_path, filename)
+        # 文件大小在上传解析时已限制，超出时直接返回 413，无需读入内存
         
-        # 删除旧头像
-        if current_user.avatar_url:
+        # 删除旧头像（仅限旧版按用户命名的文件；内容寻址存储中的图片可能被共享，由回收任务处理）
+        if current_user.avatar_url and not current_user.avatar_url.startswith(f"/uploads/{BLOB_SUBFOLDER}/"):
             # 从 URL 转换为本地文件系统路径
             # URL 示例: /uploads/avatars/user1_123.jpg
             # app.static_folder 是 'backend/backend/static'
@@ -154,11 +189,10 @@ def update_profile(current_user):
                 except OSError as e:
                     print(f"Error deleting old avatar: {e}")
 
-        # 保存新文件
-        file.save(filepath)
-        
-        # 更新数据库的头像 URL (使用相对路径)
-        avatar_url = f"/uploads/{AVATAR_SUBFOLDER}/{filename}".replace('\\', '/')
+        # 按内容哈希保存，重复上传同一张图片不会产生新文件
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        avatar_asset, _ = store_image(file.stream, ext)
+        avatar_url = avatar_asset.path
      
         # 获取其他表单字段
         nickname = request.form.get('nickname', current_user.nickname)
@@ -175,11 +209,15 @@ def update_profile(current_user):
     # 3. 验证昵称
     if not (2 <= len(nickname) <= 16):
         return jsonify({'success': False, 'message': '昵称长度必须在 2 到 16 个字符之间'}), 400
+    if nickname != current_user.nickname and find_sensitive_words(nickname):
+        return jsonify({'success': False, 'message': '昵称包含敏感词，请修改后重试'}), 400
     
     # 4. 更新数据库
     current_user.nickname = nickname
     current_user.bio = bio
     current_user.avatar_url = avatar_url
+    if avatar_asset:
+        replace_avatar_ref(current_user, avatar_asset)
     # --- 添加日志 ---
     log_user_action(current_user, 'UPDATE_PROFILE', detail=f"Avatar: {avatar_url}, Nickname: {nickname}, Bio: {(bio[:20] if bio else 'None')}")
     db.session.commit()
@@ -209,23 +247,48 @@ def update_profile(current_user):
 @user_bp.route('/favorites', methods=['GET'])
 @token_required
 def get_favorites(current_user):
-    favorites = current_user.favorites
-    items = []
-    
-    for fav in favorites:
-        # 通过收藏记录中的 wiki_id 查询完整的 location 信息
-        location = Location.query.get(fav.wiki_id)
-        if location:
-            items.append({
-                'buildingId': fav.building_id,
-                'wikiId': fav.wiki_id,
-                'name': location.name,
-                'description': location.address, # 使用地址作为描述
-                'imageUrl': location.main_image,
-                'type': location.structured_info.get('type', '') if location.structured_info else ''
-            })
-            
-    return jsonify({"items": items})
+    """
+    按收藏时间倒序游标分页获取收藏列表。
+    首页不传 cursor，之后传入上一页返回的 nextCursor。
+    地点信息在同一条查询中关联取出，已删除或未发布的地点直接在 SQL 中过滤。
+    """
+    page_size = clamp_page_size(request.args.get('pageSize', 20, type=int), default=20)
+    cursor = request.args.get('cursor')
+
+    query = db.session.query(
+        Favorite.id,
+        Favorite.created_at,
+        Favorite.building_id,
+        Favorite.wiki_id,
+        Location.name,
+        Location.address,
+        Location.main_image,
+        Location.structured_info
+    ).join(Location, Location.id == Favorite.wiki_id).filter(
+        Favorite.user_id == current_user.id,
+        Location.status == 'published',
+        Location.deleted_at.is_(None)
+    )
+    try:
+        rows, next_cursor = paginate_keyset(query, Favorite.created_at, Favorite.id, cursor, page_size)
+    except InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+
+    items = [{
+        'buildingId': row.building_id,
+        'wikiId': row.wiki_id,
+        'name': row.name,
+        'description': row.address, # 使用地址作为描述
+        'imageUrl': row.main_image,
+        'type': row.structured_info.get('type', '') if row.structured_info else ''
+    } for row in rows]
+
+    return jsonify({
+        "items": items,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "pageSize": page_size
+    })
 
 @user_bp.route('/favorites', methods=['POST'])
 @token_required
@@ -288,6 +351,38 @@ def get_favorite_status(current_user):
     is_favorited = query.first() is not None
     return jsonify({"favorited": is_favorited})
 
+
+# --- 新增：批量查询收藏状态（地图标记） ---
+MAX_FAVORITE_STATUS_IDS = 500
+
+
+@user_bp.route('/favorites/status', methods=['POST'])
+@token_required
+def get_favorite_status_batch(current_user):
+    """
+    一次查询多个建筑的收藏状态，返回其中已收藏的 buildingId。
+    使用 (user_id, building_id) 唯一索引，一条 IN 查询完成。
+    """
+    data = request.get_json(silent=True) or {}
+    building_ids = data.get('buildingIds')
+    if not isinstance(building_ids, list):
+        return jsonify({"message": "buildingIds must be a list"}), 400
+    if len(building_ids) > MAX_FAVORITE_STATUS_IDS:
+        return jsonify({"message": f"buildingIds 最多 {MAX_FAVORITE_STATUS_IDS} 个"}), 400
+    try:
+        building_ids = {int(building_id) for building_id in building_ids}
+    except (TypeError, ValueError):
+        return jsonify({"message": "buildingIds must be integers"}), 400
+
+    favorited = []
+    if building_ids:
+        rows = db.session.query(Favorite.building_id).filter(
+            Favorite.user_id == current_user.id,
+            Favorite.building_id.in_(building_ids)
+        ).all()
+        favorited = sorted(building_id for building_id, in rows)
+    return jsonify({"favorited": favorited})
+
 # --- 浏览历史 History ---
 @user_bp.route('/history', methods=['GET'])
 @token_required
@@ -340,9 +435,14 @@ def clear_history(current_user):
 @user_bp.route('/messages', methods=['GET'])
 @token_required
 def get_user_messages(current_user):
-    """获取当前用户的消息列表，支持按类型和已读状态筛选"""
+    """
+    按时间倒序游标分页获取当前用户的消息，支持按类型和已读状态筛选。
+    首页不传 cursor，之后传入上一页返回的 nextCursor。
+    """
     message_type = request.args.get('type')
     unread_only = request.args.get('unread') == 'true'
+    page_size = clamp_page_size(request.args.get('pageSize', 20, type=int), default=20)
+    cursor = request.args.get('cursor')
     
     query = Message.query.filter_by(user_id=current_user.id)
     
@@ -351,38 +451,39 @@ def get_user_messages(current_user):
     
     if unread_only:
         query = query.filter_by(is_read=False)
-        
-    messages = query.order_by(Message.created_at.desc()).all()
-    
-    message_list = [{
-        "id": m.id,
-        "type": m.type,
-        "content": m.content,
-        "relatedComment": m.related_comment,
-        "linkUrl": m.link,
-        "isRead": m.is_read,
-        "createdAt": m.created_at.isoformat() + 'Z'
-    } for m in messages]
+
+    try:
+        messages, next_cursor = paginate_keyset(query, Message.created_at, Message.id, cursor, page_size)
+    except InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
     
-    unread_count = Message.query.filter_by(user_id=current_user.id, is_read=False).count()
+    message_list = [message_payload(m) for m in messages]
     
     return jsonify({
         "messages": message_list,
-        "unreadCount": unread_count
+        "unreadCount": current_user.unread_count,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "pageSize": page_size
     })
 
 @user_bp.route('/messages/<int:message_id>/read', methods=['PUT'])
 @token_required
 def mark_message_read(current_user, message_id):
     """将单条消息标记为已读"""
-    msg = Message.query.filter_by(id=message_id, user_id=current_user.id).first()
-    if not msg:
-        return jsonify({"message": "消息不存在"}), 404
-    
-    if not msg.is_read:
-        msg.is_read = True
-        log_user_action(current_user, 'MARK_MESSAGE_READ', detail={"message_id": message_id})
-        db.session.commit()
+    # 带条件的 UPDATE，只有未读 -> 已读时才影响 1 行并递减未读数
+    updated = Message.query.filter_by(id=message_id, user_id=current_user.id, is_read=False).update(
+        {'is_read': True}, synchronize_session=False
+    )
+    if not updated:
+        if not db.session.query(Message.id).filter_by(id=message_id, user_id=current_user.id).first():
+            return jsonify({"message": "消息不存在"}), 404
+        return jsonify({"success": True, "message": "已标记为已读"})
+
+    bump_unread_count(current_user.id, -updated)
+    log_user_action(current_user, 'MARK_MESSAGE_READ', detail={"message_id": message_id})
+    db.session.commit()
+    publish_unread_count(current_user.id)
         
     return jsonify({"success": True, "message": "已标记为已读"})
 
@@ -390,37 +491,94 @@ def mark_message_read(current_user, message_id):
 @token_required
 def delete_message(current_user, message_id):
     """删除单条消息"""
-    msg = Message.query.filter_by(id=message_id, user_id=current_user.id).first()
-    if msg:
-        db.session.delete(msg)
+    # 先按未读条件删除，影响 0 行时再删除已读消息，据此决定是否递减未读数
+    unread_deleted = Message.query.filter_by(id=message_id, user_id=current_user.id, is_read=False).delete(
+        synchronize_session=False
+    )
+    deleted = unread_deleted or Message.query.filter_by(id=message_id, user_id=current_user.id).delete(
+        synchronize_session=False
+    )
+    if deleted:
+        bump_unread_count(current_user.id, -unread_deleted)
         log_user_action(current_user, 'DELETE_MESSAGE', detail={"message_id": message_id})
         db.session.commit()
+        if unread_deleted:
+            publish_unread_count(current_user.id)
     return jsonify({"success": True, "message": "消息已删除"})
 
 @user_bp.route('/messages/read-all', methods=['PUT'])
 @token_required
 def mark_all_messages_read(current_user):
     """将所有未读消息标记为已读"""
-    updated_count = Message.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
+    updated_count = Message.query.filter_by(user_id=current_user.id, is_read=False).update(
+        {'is_read': True}, synchronize_session=False
+    )
+    # 按实际更新的行数递减，期间新写入的消息仍计入未读
+    bump_unread_count(current_user.id, -updated_count)
     log_user_action(current_user, 'MARK_ALL_MESSAGES_READ', detail={"count": updated_count})
     db.session.commit()
+    publish_unread_count(current_user.id)
     return jsonify({"success": True, "message": "已全部标记为已读", "count": updated_count})
 
 @user_bp.route('/messages/clear', methods=['DELETE'])
 @token_required
 def clear_all_messages(current_user):
     """清空当前用户的所有消息"""
-    deleted_count = Message.query.filter_by(user_id=current_user.id).delete()
+    unread_deleted = Message.query.filter_by(user_id=current_user.id, is_read=False).delete(synchronize_session=False)
+    deleted_count = unread_deleted + Message.query.filter_by(user_id=current_user.id).delete(synchronize_session=False)
+    bump_unread_count(current_user.id, -unread_deleted)
     log_user_action(current_user, 'CLEAR_ALL_MESSAGES', detail={"count": deleted_count})
     db.session.commit()
+    publish_unread_count(current_user.id)
     return jsonify({"success": True, "message": "已清空所有消息", "count": deleted_count})
 
 @user_bp.route('/messages/unread-count', methods=['GET'])
 @token_required
 def get_unread_count(current_user):
-    """获取未读消息数量"""
-    count = Message.query.filter_by(user_id=current_user.id, is_read=False).count()
-    return jsonify({"count": count})
+    """获取未读消息数量（认证时已按主键读取用户，无需额外查询）"""
+    return jsonify({"count": current_user.unread_count})
+
+# --- 新增：消息推送 (SSE)，替代客户端轮询未读数 ---
+@user_bp.route('/messages/stream', methods=['GET'])
+@token_required
+def stream_messages(current_user):
+    """
+    以 text/event-stream 推送 message（新消息）和 unread-count（未读数）事件。
+    携带 Last-Event-ID 头重连时，先补发该 ID 之后的消息。
+    每个进程的连接数受 MESSAGE_STREAM_MAX_CONNECTIONS 限制，超出时返回 503；
+    单个连接最长保持 MESSAGE_STREAM_MAX_SECONDS 秒。
+    sync worker 下不保持连接，发送当前状态后立即结束，由客户端定期重连。
+    """
+    # gthread / gevent worker 的 wsgi.multithread 为真；sync worker 只有一个线程，长连接会占住整个 worker
+    streaming = request.environ.get('wsgi.multithread', False)
+    subscription = None
+    if streaming:
+        max_connections = current_app.config.get('MESSAGE_STREAM_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)
+        try:
+            subscription = subscribe(current_user.id, max_connections)
+        except TooManyConnections:
+            response = jsonify({"message": "连接数过多，请稍后重试"})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+    unread_count = current_user.unread_count
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    backlog = missed_messages(current_user.id, last_event_id) if last_event_id else []
+    # 长连接期间不占用数据库连接
+    db.session.remove()
+
+    if subscription is None:
+        events = snapshot_events(unread_count, backlog)
+    else:
+        max_seconds = current_app.config.get('MESSAGE_STREAM_MAX_SECONDS', DEFAULT_MAX_SECONDS)
+        events = stream_events(subscription, unread_count, backlog, max_seconds)
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # 关闭 nginx 缓冲
+    if subscription is not None:
+        # 数据流未开始迭代就被关闭时，生成器的 finally 不会执行，这里兜底取消订阅
+        response.call_on_close(lambda: unsubscribe(subscription))
+    return response
 
 
 # # --- 我的评论 My Reviews ---
@@ -442,72 +600,105 @@ def get_unread_count(current_user):
 #     return jsonify({"items": items})
 
 # --- 新增：获取用户所有评论和回复的接口 ---
+def _my_comments_branch(kind, user_id, cursor, limit):
+    """
+    “我的评论”中的一路查询：评论或回复，已关联地点和被回复评论的作者。
+    两张表的 id 会重复，用 sort_id = id * 2 (+1) 作为统一的排序键。
+    每一路单独按 (created_at, id) 走索引取 limit 条，合并后只需对少量行排序。
+    """
+    if kind == 'review':
+        query = select(
+            literal('review').label('kind'),
+            Review.id.label('id'),
+            (Review.id * 2).label('sort_id'),
+            Review.created_at.label('created_at'),
+            Review.location_id.label('location_id'),
+            Location.name.label('location_name'),
+            Review.rating.label('rating'),
+            Review.comment.label('comment'),
+            null().label('parent_id'),
+            null().label('parent_user_name'),
+            null().label('parent_comment')
+        ).join(Location, Location.id == Review.location_id).where(Review.user_id == user_id)
+        created_col, id_col, offset = Review.created_at, Review.id, 0
+    else:
+        parent = aliased(Review)
+        parent_author = aliased(User)
+        query = select(
+            literal('reply').label('kind'),
+            ReviewReply.id.label('id'),
+            (ReviewReply.id * 2 + 1).label('sort_id'),
+            ReviewReply.created_at.label('created_at'),
+            parent.location_id.label('location_id'),
+            Location.name.label('location_name'),
+            null().label('rating'),
+            ReviewReply.content.label('comment'),
+            parent.id.label('parent_id'),
+            parent_author.nickname.label('parent_user_name'),
+            parent.comment.label('parent_comment')
+        ).join(parent, parent.id == ReviewReply.review_id) \
+         .join(Location, Location.id == parent.location_id) \
+         .join(parent_author, parent_author.id == parent.user_id) \
+         .where(ReviewReply.user_id == user_id)
+        created_col, id_col, offset = ReviewReply.created_at, ReviewReply.id, 1
+
+    if cursor:
+        created_at, sort_id = cursor
+        # id * 2 + offset < sort_id 换算成对 id 列本身的比较，以便使用索引
+        query = query.where(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < (sort_id + 1 - offset) // 2)
+        ))
+    query = query.order_by(created_col.desc(), id_col.desc()).limit(limit)
+    # 包一层子查询，各数据库都允许 UNION 的分支带 ORDER BY / LIMIT
+    sub = query.subquery()
+    return select(*sub.c)
+
+
 @user_bp.route('/my-comments', methods=['GET'])
 @token_required
 def get_my_reviews(current_user):
     """
-    获取当前用户发布的所有顶级评论和回复。
+    按时间倒序游标分页获取当前用户发布的顶级评论和回复。
+    首页不传 cursor，之后传入上一页返回的 nextCursor。
     """
-    page = request.args.get('page', 1, type=int)
-    page_size = request.args.get('pageSize', 10, type=int)
-
-    # 1. 获取用户的顶级评论
-    top_level_reviews = Review.query.filter_by(user_id=current_user.id).all()
-    
-    # 2. 获取用户的回复
-    replies = ReviewReply.query.filter_by(user_id=current_user.id).all()
-
-    # 3. 格式化并合并两种评论
-    all_my_comments = []
-    # 处理顶级评论
-    for review in top_level_reviews:
-        all_my_comments.append({
-            "id": review.id,
-            "type": "review", # 内部使用的类型
-            "wikiId": review.location_id, # 假设 Location 模型有关联到 Wiki
-            "locationId": review.location_id,
-            "locationName": review.location.name,
-            "rating": review.rating,
-            "comment": review.comment,
-            "createdAt": review.created_at.replace(tzinfo=timezone.utc).isoformat(),
-            "parentId": None,
-            "parentUserName": None,
-            "parentComment": None
-        })
-    # 处理回复
-    for reply in replies:
-        parent_review = reply.review # 获取被回复的顶级评论
-        all_my_comments.append({
-            "id": reply.id,
-            "type": "reply", # 内部使用的类型
-            "wikiId": parent_review.location_id,
-            "locationId": parent_review.location_id,
-            "locationName": parent_review.location.name,
-            "rating": None, # 回复没有评分
-            "comment": reply.content,
-            "createdAt": reply.created_at.replace(tzinfo=timezone.utc).isoformat(),
-            "parentId": parent_review.id,
-            "parentUserName": parent_review.author.nickname,
-            "parentComment": parent_review.comment
-        })
-
-    # 4. 按创建时间降序排序
-    all_my_comments.sort(key=lambda x: x['createdAt'], reverse=True)
-
-    # 5. 手动分页
-    total_items = len(all_my_comments)
-    start = (page - 1) * page_size
-    end = start + page_size
-    paginated_items = all_my_comments[start:end]
-
-    # 移除内部使用的 'type' 字段
-    for item in paginated_items:
-        del item['type']
+    page_size = clamp_page_size(request.args.get('pageSize', 10, type=int))
+    cursor = request.args.get('cursor')
+    try:
+        position = decode_cursor(cursor, 'created_at') if cursor else None
+    except InvalidCursor as e:
+        return jsonify({"message": str(e)}), 400
+
+    # 评论和回复各取 page_size + 1 条，合并排序后多出的一条用于判断是否还有下一页
+    merged = union_all(
+        _my_comments_branch('review', current_user.id, position, page_size + 1),
+        _my_comments_branch('reply', current_user.id, position, page_size + 1)
+    ).subquery()
+    rows = db.session.execute(
+        select(merged).order_by(merged.c.created_at.desc(), merged.c.sort_id.desc()).limit(page_size + 1)
+    ).all()
+
+    items = [{
+        "id": row.id,
+        "wikiId": row.location_id,
+        "locationId": row.location_id,
+        "locationName": row.location_name,
+        "rating": row.rating,
+        "comment": row.comment,
+        "createdAt": row.created_at.replace(tzinfo=timezone.utc).isoformat(),
+        "parentId": row.parent_id,
+        "parentUserName": row.parent_user_name,
+        "parentComment": row.parent_comment
+    } for row in rows[:page_size]]
+
+    next_cursor = None
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        next_cursor = encode_cursor('created_at', last.created_at, last.sort_id)
 
     return jsonify({
-        "items": paginated_items,
-        "total": total_items,
-        "page": page,
-        "pageSize": page_size,
-        "pages": (total_items + page_size - 1) // page_size
+        "items": items,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None,
+        "pageSize": page_size
     }), 200
@@ -0,0 +1,147 @@
+"""
+异步、批量写入的用户操作日志 (UserLog)。
+
+log_user_action 不再把 UserLog 加进调用方的事务，而是先记在会话上，
+事务提交后放入进程内的环形缓冲区，回滚时丢弃；
+后台线程每 AUDIT_LOG_FLUSH_SECONDS 秒取出缓冲区中的全部事件，一次批量插入。
+- 缓冲区满时丢弃最早的事件并计数；
+- 高频操作可按 AUDIT_LOG_SAMPLE_RATES 只记录一部分；
+- 进程退出时写入剩余事件；
+- audit_log_stats 返回队列深度、丢弃数等指标。
+"""
+import atexit
+import datetime
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from ..models.models import db, UserLog
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SECONDS = 2
+DEFAULT_BUFFER_SIZE = 10000
+# 单条 INSERT 最多包含的行数
+FLUSH_CHUNK_SIZE = 500
+
+_buffer = deque()
+_lock = threading.Lock()
+_dispatcher = None
+_stats = {"dropped": 0, "sampled_out": 0, "written": 0, "failed": 0}
+
+
+def record_audit_event(user_id, action, detail=None, ip=None, user_agent=None):
+    """登记一条操作日志，随当前事务提交后写入。不 commit"""
+    rate = current_app.config.get('AUDIT_LOG_SAMPLE_RATES', {}).get(action, 1)
+    if rate < 1 and random.random() >= rate:
+        with _lock:
+            _stats['sampled_out'] += 1
+        return
+    db.session.info.setdefault('audit_events', []).append({
+        "user_id": user_id,
+        "action": action,
+        "detail": detail,
+        "ip": ip,
+        "user_agent": user_agent,
+        "timestamp": datetime.datetime.utcnow()
+    })
+
+
+@event.listens_for(Session, 'after_commit')
+def _enqueue_committed_events(session):
+    events = session.info.pop('audit_events', None)
+    if not events:
+        return
+    app = current_app._get_current_object()
+    capacity = app.config.get('AUDIT_LOG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE)
+    with _lock:
+        for item in events:
+            if len(_buffer) >= capacity:
+                _buffer.popleft()
+                _stats['dropped'] += 1
+            _buffer.append(item)
+
+    if app.config.get('AUDIT_LOG_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS) <= 0:
+        # 同步模式（测试、调试用），写入失败不影响已提交的业务事务
+        try:
+            flush_audit_log()
+        except Exception as e:
+            log.warning(f"[操作日志] 写入失败: {e}")
+    else:
+        _ensure_dispatcher(app)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted_events(session):
+    session.info.pop('audit_events', None)
+
+
+def flush_audit_log():
+    """
+    写入缓冲区中的全部事件，返回写入的行数。需在应用上下文中调用。
+    使用独立的会话，可以在其他会话的提交事件中调用。
+    """
+    with _lock:
+        batch = list(_buffer)
+        _buffer.clear()
+    if not batch:
+        return 0
+
+    try:
+        with Session(db.engine) as session, session.begin():
+            for start in range(0, len(batch), FLUSH_CHUNK_SIZE):
+                session.execute(insert(UserLog), batch[start:start + FLUSH_CHUNK_SIZE])
+    except Exception:
+        with _lock:
+            _stats['failed'] += len(batch)
+        raise
+    with _lock:
+        _stats['written'] += len(batch)
+    return len(batch)
+
+
+def audit_log_stats():
+    with _lock:
+        return {
+            "queueDepth": len(_buffer),
+            "dropped": _stats['dropped'],
+            "sampledOut": _stats['sampled_out'],
+            "written": _stats['written'],
+            "failed": _stats['failed']
+        }
+
+
+def _run(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush_audit_log()
+            except Exception as e:
+                log.warning(f"[操作日志] 批量写入失败: {e}")
+
+
+def _flush_at_exit(app):
+    with app.app_context():
+        try:
+            flush_audit_log()
+        except Exception as e:
+            log.warning(f"[操作日志] 退出时写入失败: {e}")
+
+
+def _ensure_dispatcher(app):
+    global _dispatcher
+    if _dispatcher is not None:
+        return
+    with _lock:
+        if _dispatcher is None:
+            interval = app.config.get('AUDIT_LOG_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+            _dispatcher = threading.Thread(target=_run, args=(app, interval), name='audit-log-writer', daemon=True)
+            _dispatcher.start()
+            atexit.register(_flush_at_exit, app)
@@ -0,0 +1,48 @@
+"""
+与数据库方言相关的批量写入工具。
+"""
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from ..models.models import db
+
+# 单条多值 INSERT 最多包含的行数
+INSERT_CHUNK_SIZE = 500
+
+
+def insert_ignore(model, rows, session=None):
+    """
+    批量插入，主键/唯一键冲突的行被忽略：
+    MySQL 使用 INSERT IGNORE，SQLite、PostgreSQL 使用 ON CONFLICT DO NOTHING。
+    返回实际插入的行数。不 commit。
+    """
+    session = session or db.session
+    if isinstance(rows, dict):
+        rows = [rows]
+    dialect = session.get_bind().dialect.name
+
+    if dialect not in ('mysql', 'sqlite', 'postgresql'):
+        # 其他数据库：逐行在保存点中插入
+        inserted = 0
+        for row in rows:
+            try:
+                with session.begin_nested():
+                    session.execute(insert(model).values(**row))
+                inserted += 1
+            except IntegrityError:
+                pass
+        return inserted
+
+    if dialect == 'mysql':
+        base = insert(model).prefix_with('IGNORE')
+    else:
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        base = dialect_insert(model).on_conflict_do_nothing()
+
+    inserted = 0
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        inserted += session.execute(base.values(rows[start:start + INSERT_CHUNK_SIZE])).rowcount
+    return inserted
@@ -0,0 +1,187 @@
+"""
+去除图片中的元数据（EXIF、GPS、XMP、IPTC、文本注释等）。
+
+按文件结构逐段复制，不解码像素，也不依赖 Pillow，在请求线程中保存原图前调用：
+- JPEG：丢弃 APP1 (EXIF / XMP)、APP13 (IPTC) 和 COM 段；
+- PNG：丢弃 eXIf、tEXt、zTXt、iTXt、tIME 块；
+- WebP：丢弃 EXIF、XMP 块，并修正 RIFF 长度和 VP8X 标志位。
+JPEG / WebP 的 EXIF 方向 (Orientation) 以只含这一项的最小 EXIF 保留，否则手机竖拍的照片会显示为横向。
+格式按文件头识别，与扩展名无关；结构异常时其余内容原样复制。
+"""
+import struct
+
+CHUNK_SIZE = 64 * 1024
+
+JPEG_SOI = b'\xff\xd8'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+ORIENTATION_TAG = 0x0112
+
+# JPEG 中需要丢弃的段：APP1、APP13、COM
+JPEG_DROP_MARKERS = {0xE1, 0xED, 0xFE}
+# JPEG 中不带长度字段的标记
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+PNG_DROP_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+WEBP_DROP_CHUNKS = {b'EXIF', b'XMP '}
+# VP8X 标志位
+WEBP_FLAG_EXIF = 0x08
+WEBP_FLAG_XMP = 0x04
+
+
+def strip_metadata(f):
+    """
+    f 为以二进制方式打开、可 seek 的文件。
+    返回去除元数据后内容的字节块迭代器；不是 JPEG / PNG / WebP 时返回 None。
+    """
+    head = f.read(12)
+    f.seek(0)
+    if head.startswith(JPEG_SOI):
+        return _strip_jpeg(f)
+    if head.startswith(PNG_SIGNATURE):
+        return _strip_png(f)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return _strip_webp(f)
+    return None
+
+
+def _copy_rest(f):
+    yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+def _exif_orientation(tiff):
+    """从 TIFF 结构的 EXIF 数据中读取方向，没有或无法解析时返回 None"""
+    if tiff.startswith(EXIF_HEADER):
+        tiff = tiff[len(EXIF_HEADER):]
+    try:
+        order = {b'II': '<', b'MM': '>'}[tiff[:2]]
+        (ifd_offset,) = struct.unpack(order + 'I', tiff[4:8])
+        (count,) = struct.unpack(order + 'H', tiff[ifd_offset:ifd_offset + 2])
+        for i in range(count):
+            start = ifd_offset + 2 + i * 12
+            tag, kind, _, value = struct.unpack(order + 'HHIH', tiff[start:start + 10])
+            if tag == ORIENTATION_TAG and kind == 3:
+                return value if 1 <= value <= 8 else None
+    except (KeyError, struct.error):
+        pass
+    return None
+
+
+def _orientation_tiff(orientation):
+    """只包含方向一项的 EXIF (TIFF) 数据"""
+    return (b'MM\x00\x2a' + struct.pack('>I', 8) + struct.pack('>H', 1)
+            + struct.pack('>HHIHH', ORIENTATION_TAG, 3, 1, orientation, 0) + struct.pack('>I', 0))
+
+
+def _strip_jpeg(f):
+    yield f.read(2)
+    orientation_written = False
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            yield marker
+            break
+        code = marker[1]
+        # 标记前可以有任意个 0xFF 填充字节
+        while code == 0xFF:
+            byte = f.read(1)
+            if not byte:
+                return
+            code = byte[0]
+        marker = bytes((0xFF, code))
+        # 图像数据 (SOS) 之后不再有元数据段，其余内容原样复制
+        if code in (0xDA, 0xD9):
+            yield marker
+            break
+        if code in JPEG_STANDALONE_MARKERS:
+            yield marker
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            yield marker + length_bytes
+            break
+        (length,) = struct.unpack('>H', length_bytes)
+        payload = f.read(max(length - 2, 0))
+        if code not in JPEG_DROP_MARKERS:
+            yield marker + length_bytes + payload
+            continue
+        if code == 0xE1 and payload.startswith(EXIF_HEADER) and not orientation_written:
+            orientation = _exif_orientation(payload)
+            if orientation and orientation != 1:
+                exif = EXIF_HEADER + _orientation_tiff(orientation)
+                yield b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+                orientation_written = True
+    yield from _copy_rest(f)
+
+
+def _strip_png(f):
+    yield f.read(len(PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            yield header
+            return
+        (length,) = struct.unpack('>I', header[:4])
+        chunk_type = header[4:]
+        if chunk_type in PNG_DROP_CHUNKS:
+            f.seek(length + 4, 1) # 数据和 CRC
+            continue
+        yield header
+        remaining = length + 4
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+        if chunk_type == b'IEND':
+            return
+
+
+def _strip_webp(f):
+    # 先读出所有块的位置，才能在输出前算出新的 RIFF 长度
+    f.seek(0, 2)
+    end = f.tell()
+    f.seek(12)
+    chunks = [] # (类型, 数据偏移, 数据长度)
+    orientation = None
+    while f.tell() + 8 <= end:
+        chunk_type, size = struct.unpack('<4sI', f.read(8))
+        offset = f.tell()
+        if offset + size > end:
+            break
+        if chunk_type == b'EXIF' and orientation is None:
+            orientation = _exif_orientation(f.read(size))
+        chunks.append((chunk_type, offset, size))
+        f.seek(offset + size + (size & 1))
+    if f.tell() < end or not any(t == b'VP8X' for t, _, _ in chunks):
+        # 结构异常，或是不能携带元数据的简单格式
+        f.seek(0)
+        yield from _copy_rest(f)
+        return
+
+    exif = _orientation_tiff(orientation) if orientation and orientation != 1 else None
+    kept = [c for c in chunks if c[0] not in WEBP_DROP_CHUNKS]
+    body_size = 4 + sum(8 + size + (size & 1) for _, _, size in kept)
+    if exif:
+        body_size += 8 + len(exif) + (len(exif) & 1)
+    yield b'RIFF' + struct.pack('<I', body_size) + b'WEBP'
+
+    for chunk_type, offset, size in kept:
+        f.seek(offset)
+        yield struct.pack('<4sI', chunk_type, size)
+        if chunk_type == b'VP8X':
+            data = bytearray(f.read(size))
+            data[0] &= ~WEBP_FLAG_XMP & 0xFF
+            data[0] = data[0] | WEBP_FLAG_EXIF if exif else data[0] & ~WEBP_FLAG_EXIF & 0xFF
+            yield bytes(data) + b'\x00' * (size & 1)
+            continue
+        remaining = size + (size & 1)
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    # EXIF 块按规范放在图像数据之后
+    if exif:
+        yield struct.pack('<4sI', b'EXIF', len(exif)) + exif + b'\x00' * (len(exif) & 1)
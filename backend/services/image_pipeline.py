@@ -0,0 +1,155 @@
+"""
+评论图片后台处理管线。
+
+请求线程只负责保存原图（保存前已由 image_metadata 去除 EXIF）并做一次只读取文件头的格式校验；
+完整解码、生成缩略图/中图 (WebP + JPEG) 在进程池中完成，
+完成后回写 ImageAsset 的尺寸、变体和状态。
+Pillow 为可选依赖，未安装时跳过处理，只提供原图。
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from flask import current_app
+
+from ..models.models import db, ImageAsset
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+log = logging.getLogger(__name__)
+
+# 变体名称 -> 最长边像素
+VARIANT_SIZES = {'thumb': 320, 'medium': 1024}
+VARIANT_SUBFOLDER = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def pipeline_enabled():
+    return Image is not None
+
+
+def probe_image(stream):
+    """
+    只读取文件头判断是否为可识别的图片，返回格式名（如 'JPEG'），无法识别时返回 None。
+    读取后会将流复位。
+    """
+    if Image is None:
+        return 'UNKNOWN'
+    try:
+        with Image.open(stream) as img:
+            return img.format
+    except Exception:
+        return None
+    finally:
+        stream.seek(0)
+
+
+def _process_image_file(path, variant_dir, stem):
+    """在子进程中运行：完整解码、按 EXIF 方向旋转并生成各尺寸变体（变体不含 EXIF）"""
+    with Image.open(path) as original:
+        original.load()
+        img = ImageOps.exif_transpose(original)
+
+        width, height = img.size
+        os.makedirs(variant_dir, exist_ok=True)
+
+        variants = {}
+        for name, max_side in VARIANT_SIZES.items():
+            variant = img.copy()
+            variant.thumbnail((max_side, max_side)) # 不会放大小图
+            webp_name = f"{stem}_{name}.webp"
+            jpeg_name = f"{stem}_{name}.jpg"
+            variant.save(os.path.join(variant_dir, webp_name), 'WEBP', quality=80)
+            variant.convert('RGB').save(
+                os.path.join(variant_dir, jpeg_name), 'JPEG', quality=82, optimize=True, progressive=True
+            )
+            variants[name] = {
+                "width": variant.width,
+                "height": variant.height,
+                "webp": webp_name,
+                "jpeg": jpeg_name
+            }
+    return {"width": width, "height": height, "variants": variants}
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Web 进程中还有其他后台线程，fork 时可能复制到被占用的锁导致子进程死锁，改用 spawn
+            _executor = ProcessPoolExecutor(
+                max_workers=app.config.get('IMAGE_PROCESS_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _on_processed(app, asset_id, web_prefix, future):
+    with app.app_context():
+        asset = db.session.get(ImageAsset, asset_id)
+        if not asset:
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            log.warning(f"[图片处理] 处理失败 asset={asset_id}: {e}")
+            asset.status = 'failed'
+        else:
+            asset.width = result['width']
+            asset.height = result['height']
+            asset.variants = {
+                name: {
+                    "width": v['width'],
+                    "height": v['height'],
+                    "webp": f"{web_prefix}/{v['webp']}",
+                    "jpeg": f"{web_prefix}/{v['jpeg']}"
+                } for name, v in result['variants'].items()
+            }
+            asset.status = 'ready'
+        db.session.commit()
+
+
+def schedule_image_processing(asset, file_path, web_folder):
+    """
+    将已提交的 ImageAsset 交给进程池处理，立即返回。
+    - file_path: 原图在磁盘上的路径
+    - web_folder: 原图所在目录的 Web 路径，如 /uploads/reviews
+    """
+    if Image is None:
+        return
+    app = current_app._get_current_object()
+    file_path = os.path.abspath(file_path)
+    variant_dir = os.path.join(os.path.dirname(file_path), VARIANT_SUBFOLDER)
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    future = _get_executor(app).submit(_process_image_file, file_path, variant_dir, stem)
+    future.add_done_callback(partial(_on_processed, app, asset.id, f"{web_folder}/{VARIANT_SUBFOLDER}"))
+
+
+def build_image_set(url, asset=None):
+    """
+    构造前端使用的响应式图片结构。
+    处理完成前只返回原图。
+    """
+    item = {"src": url, "width": None, "height": None, "thumb": url, "srcset": None}
+    if asset is None or asset.status != 'ready' or not asset.variants:
+        return item
+
+    variants = sorted(asset.variants.values(), key=lambda v: v['width'])
+    item.update({
+        "width": asset.width,
+        "height": asset.height,
+        "thumb": asset.variants.get('thumb', {}).get('jpeg', url),
+        "srcset": {
+            "webp": ', '.join(f"{v['webp']} {v['width']}w" for v in variants),
+            "jpeg": ', '.join(f"{v['jpeg']} {v['width']}w" for v in variants)
+        }
+    })
+    return item
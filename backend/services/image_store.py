@@ -0,0 +1,184 @@
+"""
+内容寻址的图片存储。
+
+上传的图片按 SHA-256 保存到 UPLOAD_FOLDER/blobs/ab/cd/<hash>.<ext>，
+保存前先去除 EXIF / GPS 等元数据，公开的原图不含拍摄信息，哈希也按去除后的内容计算，
+相同内容只保存一份，重复上传直接复用已有的 ImageAsset。
+评论、用户头像通过 ImageRef 引用图片；没有任何引用且超过保留期的图片
+由 collect_unreferenced_images 统一回收，不再由业务代码直接删除文件。
+新图片的临时文件在事务提交后才移动到最终位置，回滚时删除，不会留下没有记录的文件。
+"""
+import datetime
+import hashlib
+import logging
+import os
+import tempfile
+
+from flask import current_app
+from sqlalchemy import event, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models.models import db, ImageAsset, ImageRef
+from .image_metadata import strip_metadata
+from .uploads import BLOB_SUBFOLDER, UploadStream, upload_dir
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# 无引用图片的默认保留时间，避免回收刚上传、尚未建立引用的图片
+DEFAULT_GC_GRACE = datetime.timedelta(hours=1)
+
+
+def blob_disk_path(asset):
+    """ImageAsset 原图在磁盘上的路径"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], asset.path[len('/uploads/'):])
+
+
+def blob_web_folder(asset):
+    """ImageAsset 原图所在目录的 Web 路径，如 /uploads/blobs/ab/cd"""
+    return asset.path.rsplit('/', 1)[0]
+
+
+def _write_temp(chunks, root):
+    """将字节块写入临时文件，返回 (临时路径, sha256, 大小)"""
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=root, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in chunks:
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, hasher.hexdigest(), size
+
+
+def _strip_temp(tmp_path, root):
+    """去除临时文件中的元数据，返回新的 (临时路径, sha256, 大小)；格式无法识别时返回 None"""
+    with open(tmp_path, 'rb') as f:
+        chunks = strip_metadata(f)
+        if chunks is None:
+            return None
+        stripped = _write_temp(chunks, root)
+    os.remove(tmp_path)
+    return stripped
+
+
+def store_image(stream, ext):
+    """
+    按内容哈希保存图片流，返回 (asset, created)。
+    上传阶段已落盘的 UploadStream 直接使用其临时文件；其他流先按块写入临时文件。
+    JPEG / PNG / WebP 去除元数据后另写一份，哈希和大小按去除后的内容计算。
+    新图片的文件在调用方提交后才出现在 asset.path；内容已存在时丢弃临时文件，created 为 False。
+    不 commit，由调用方统一提交。
+    """
+    root = upload_dir()
+    os.makedirs(root, exist_ok=True)
+
+    if isinstance(stream, UploadStream):
+        digest, size = stream.hexdigest(), stream.size
+        tmp_path = stream.detach()
+    else:
+        tmp_path, digest, size = _write_temp(iter(lambda: stream.read(CHUNK_SIZE), b''), root)
+
+    pending = False
+    try:
+        stripped = _strip_temp(tmp_path, root)
+        if stripped is not None:
+            tmp_path, digest, size = stripped
+        asset = ImageAsset.query.filter_by(sha256=digest).first()
+        if asset is None:
+            rel_path = f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+            asset = ImageAsset(sha256=digest, path=f"/uploads/{BLOB_SUBFOLDER}/{rel_path}", size_bytes=size)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(asset)
+            except IntegrityError:
+                # 其他请求已插入同一哈希的记录
+                asset = ImageAsset.query.filter_by(sha256=digest).one()
+            else:
+                # 提交后再移动到最终位置，回滚时删除临时文件
+                db.session.info.setdefault('pending_blobs', []).append((tmp_path, os.path.join(root, rel_path)))
+                pending = True
+                return asset, True
+    finally:
+        if not pending and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # 刷新时间戳，防止回收任务删除刚被复用的图片
+    asset.updated_at = datetime.datetime.utcnow()
+    return asset, False
+
+
+@event.listens_for(Session, 'after_commit')
+def _move_committed_blobs(session):
+    for tmp_path, final_path in session.info.pop('pending_blobs', ()):
+        try:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            # 并发上传相同内容时可能重复替换，但内容一致，结果相同
+            os.replace(tmp_path, final_path)
+        except OSError as e:
+            log.error(f"[图片存储] 移动文件失败 {tmp_path} -> {final_path}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted_blobs(session):
+    for tmp_path, _ in session.info.pop('pending_blobs', ()):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def add_review_ref(asset, review_id):
+    if not ImageRef.query.filter_by(asset_id=asset.id, review_id=review_id).first():
+        db.session.add(ImageRef(asset_id=asset.id, kind='review', review_id=review_id))
+
+
+def replace_avatar_ref(user, asset):
+    """将用户的头像引用替换为 asset，旧头像变为无引用后等待回收"""
+    ImageRef.query.filter(
+        ImageRef.user_id == user.id, ImageRef.kind == 'avatar', ImageRef.asset_id != asset.id
+    ).delete(synchronize_session=False)
+    if not ImageRef.query.filter_by(asset_id=asset.id, user_id=user.id).first():
+        db.session.add(ImageRef(asset_id=asset.id, kind='avatar', user_id=user.id))
+
+
+def collect_unreferenced_images(grace=DEFAULT_GC_GRACE):
+    """
+    删除没有任何引用且超过保留期的图片（原图、变体文件及 ImageAsset 记录）。
+    只处理内容寻址存储中的图片。返回删除的数量。
+    """
+    cutoff = datetime.datetime.utcnow() - grace
+    assets = ImageAsset.query.filter(
+        ImageAsset.sha256.isnot(None),
+        ImageAsset.updated_at < cutoff,
+        ~exists().where(ImageRef.asset_id == ImageAsset.id)
+    ).all()
+
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    for asset in assets:
+        paths = [blob_disk_path(asset)]
+        for variant in (asset.variants or {}).values():
+            paths += [os.path.join(upload_root, variant[k][len('/uploads/'):]) for k in ('webp', 'jpeg')]
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning(f"[图片回收] 删除文件失败 {path}: {e}")
+        db.session.delete(asset)
+    db.session.commit()
+
+    # 清理上传中断后残留的临时文件
+    root = upload_dir()
+    if os.path.isdir(root):
+        for entry in os.scandir(root):
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff.replace(tzinfo=datetime.timezone.utc).timestamp():
+                os.remove(entry.path)
+    return len(assets)
@@ -0,0 +1,51 @@
+"""
+地图数据增量同步。
+
+每次 flush 中新建、修改或删除的 Location 都会被打上同一个递增的 change_seq；
+硬删除的地点额外写入 LocationTombstone。客户端携带上次同步得到的序号，
+即可只获取之后发生变化的地点。
+
+序号来自 sync_sequences 表中的计数行：UPDATE 会持有该行锁直到事务提交，
+因此序号较小的事务一定先于序号较大的事务提交，客户端不会跳过尚未提交的变更。
+"""
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+
+from ..models.models import db, Location, LocationTombstone, SyncSequence
+
+LOCATION_SEQUENCE = 'locations'
+
+
+def next_location_seq(session=None):
+    """在当前事务中分配下一个地点变更序号"""
+    session = session or db.session
+    conn = session.connection()
+    table = SyncSequence.__table__
+    result = conn.execute(
+        update(table).where(table.c.name == LOCATION_SEQUENCE).values(value=table.c.value + 1)
+    )
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(name=LOCATION_SEQUENCE, value=1))
+        return 1
+    return conn.execute(select(table.c.value).where(table.c.name == LOCATION_SEQUENCE)).scalar_one()
+
+
+def current_location_seq():
+    """读取已提交的最新序号"""
+    return db.session.query(SyncSequence.value).filter_by(name=LOCATION_SEQUENCE).scalar() or 0
+
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_location_changes(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, Location)]
+    changed += [obj for obj in session.dirty if isinstance(obj, Location) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Location)]
+    if not changed and not deleted:
+        return
+
+    # 同一次 flush 内的变更共用一个序号
+    seq = next_location_seq(session)
+    for loc in changed:
+        loc.change_seq = seq
+    for loc in deleted:
+        session.add(LocationTombstone(location_id=loc.id, building_id=loc.building_id, change_seq=seq))
@@ -0,0 +1,69 @@
+"""
+登录限流。
+
+按手机号和 IP 各维护一个令牌桶：每次尝试消耗一个令牌，令牌按固定速率恢复。
+桶空时直接拒绝，不查询数据库、不计算密码哈希，撞库请求只消耗很少的资源。
+登录成功后清空该手机号的失败记录。
+
+令牌桶保存在进程内存中，多进程部署时每个进程分别计数，实际上限约为配置值 × 进程数。
+桶的数量有上限，超过时淘汰最久未使用的桶。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+# (容量, 恢复一个令牌所需的秒数)
+DEFAULT_PHONE_LIMIT = (5, 60)
+DEFAULT_IP_LIMIT = (30, 2)
+MAX_BUCKETS = 100000
+
+
+class TokenBuckets:
+    """一组按 key 区分的令牌桶"""
+
+    def __init__(self, max_buckets=MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict() # key -> (令牌数, 上次更新时间)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_seconds, now=None):
+        """消耗一个令牌，成功返回 0，否则返回需要等待的秒数"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) / refill_seconds)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) * refill_seconds
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+_phones = TokenBuckets()
+_ips = TokenBuckets()
+
+
+def check_login_attempt(phone, ip):
+    """
+    登记一次登录/注册尝试。允许时返回 0，否则返回建议的重试等待秒数。
+    phone 为空时只按 IP 限流。
+    """
+    wait = _ips.take(ip or '-', *current_app.config.get('LOGIN_THROTTLE_IP', DEFAULT_IP_LIMIT))
+    if wait or not phone:
+        return wait
+    return _phones.take(str(phone), *current_app.config.get('LOGIN_THROTTLE_PHONE', DEFAULT_PHONE_LIMIT))
+
+
+def reset_login_attempts(phone):
+    """登录成功后调用，清空该手机号的失败计数"""
+    _phones.reset(str(phone))
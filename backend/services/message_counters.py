@@ -0,0 +1,48 @@
+"""
+用户未读消息数 (users.unread_count)。
+
+消息写入、标记已读、删除、清空时通过 UPDATE ... SET unread_count = unread_count ± n
+原子更新，增量取自对应语句实际影响的行数；调用方负责在同一事务内提交。
+角标轮询直接读取该列（按主键读 users 行），不再对 messages 做 COUNT。
+计数出现偏差时可以运行 `flask reconcile-unread-counts` 重新计算。
+"""
+from sqlalchemy import bindparam, case, func, select, update
+
+from ..models.models import db, User, Message
+
+
+def _shifted(column, delta):
+    # 递减时不低于 0
+    return case((column + delta < 0, 0), else_=column + delta)
+
+
+def bump_unread_count(user_id, delta):
+    """调整单个用户的未读数，不 commit"""
+    if not delta:
+        return
+    db.session.execute(
+        update(User).where(User.id == user_id).values(unread_count=_shifted(User.unread_count, delta))
+    )
+
+
+def bump_unread_counts(deltas):
+    """批量调整未读数，deltas 为 {user_id: 增量}，一次 executemany 完成。不 commit"""
+    rows = [{"uid": user_id, "delta": delta} for user_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    db.session.execute(
+        update(User.__table__)
+        .where(User.__table__.c.id == bindparam('uid'))
+        .values(unread_count=_shifted(User.__table__.c.unread_count, bindparam('delta'))),
+        rows
+    )
+
+
+def reconcile_unread_counts():
+    """根据 messages 重新计算所有用户的未读数，返回更新的行数"""
+    unread = select(func.count(Message.id)).where(
+        Message.user_id == User.id, Message.is_read.is_(False)
+    ).scalar_subquery()
+    return User.query.filter(User.unread_count != unread).update(
+        {User.unread_count: unread}, synchronize_session=False
+    )
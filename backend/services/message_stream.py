@@ -0,0 +1,209 @@
+"""
+消息推送 (Server-Sent Events)。
+
+进程内的发布/订阅：每个 SSE 连接对应一个订阅，持有一个有界队列；
+消息写入、已读、删除后调用 publish_* 把事件放进该用户所有连接的队列，
+连接所在的请求线程从队列取出事件写给客户端，空闲时定期发送心跳注释行。
+message 事件带有 SSE id（消息主键），客户端携带 Last-Event-ID 重连时补发断开期间的新消息。
+
+每个连接在整个连接期间占用一个 worker 线程（或协程），因此每个进程的连接数有上限，
+部署时必须使用 gunicorn 的 gthread 或 gevent worker（environ 中 wsgi.multithread 为真）。
+sync worker 每个进程只有一个线程，一个长连接就会占住整个 worker，因此这种情况下接口不建立订阅，
+只发送当前未读数和需要补发的消息后立即结束，客户端按 POLL_RETRY_MS 的间隔重连，退化为轮询。
+每个连接最长保持 MESSAGE_STREAM_MAX_SECONDS 秒（默认 25 秒）后主动结束，由客户端重连，
+避免被代理的读超时切断；设为 0 表示不限制。
+
+订阅只在当前进程内有效。多进程部署时，其他进程写入的消息不会实时推送，
+连接每隔 RESYNC_SECONDS 秒按主键重新读取一次未读数，变化时补发事件。
+"""
+import json
+import queue
+import threading
+import time
+
+from ..models.models import db, User, Message
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_SECONDS = 25
+# 重连时最多补发的消息数
+REPLAY_LIMIT = 50
+HEARTBEAT_SECONDS = 15
+# 需小于连接的最长时间，否则短连接在校对前就已结束
+RESYNC_SECONDS = 10
+RETRY_MS = 5000
+POLL_RETRY_MS = 30000
+# 单个连接积压的事件数上限，客户端读取过慢时丢弃新事件
+QUEUE_SIZE = 100
+
+_subscribers = {} # user_id -> set(Subscription)
+_lock = threading.Lock()
+_connections = 0
+
+
+class TooManyConnections(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def put(self, event, data):
+        try:
+            self.events.put_nowait((event, data))
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def subscribe(user_id, max_connections=DEFAULT_MAX_CONNECTIONS):
+    global _connections
+    with _lock:
+        if _connections >= max_connections:
+            raise TooManyConnections()
+        subscription = Subscription(user_id)
+        _subscribers.setdefault(user_id, set()).add(subscription)
+        _connections += 1
+    return subscription
+
+
+def unsubscribe(subscription):
+    global _connections
+    with _lock:
+        subscriptions = _subscribers.get(subscription.user_id)
+        if subscriptions and subscription in subscriptions:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del _subscribers[subscription.user_id]
+            _connections -= 1
+
+
+def connection_count():
+    return _connections
+
+
+def has_subscribers(user_id):
+    return user_id in _subscribers
+
+
+def publish(user_id, event, data):
+    """向该用户在本进程内的所有连接推送事件"""
+    with _lock:
+        subscriptions = list(_subscribers.get(user_id, ()))
+    for subscription in subscriptions:
+        subscription.put(event, data)
+
+
+def message_payload(message):
+    """message 事件的数据，字段与消息列表接口一致"""
+    return {
+        "id": message.id,
+        "type": message.type,
+        "content": message.content,
+        "relatedComment": message.related_comment,
+        "linkUrl": message.link,
+        "isRead": message.is_read,
+        "createdAt": message.created_at.isoformat() + 'Z'
+    }
+
+
+def publish_messages(messages):
+    """
+    新消息写入并提交后调用，messages 为 (user_id, message_payload) 列表。
+    只为在本进程有连接的用户推送，并用一条 IN 查询取得这些用户最新的未读数。
+    """
+    online = {}
+    for user_id, payload in messages:
+        if has_subscribers(user_id):
+            online.setdefault(user_id, []).append(payload)
+    if not online:
+        return
+    counts = dict(db.session.query(User.id, User.unread_count).filter(User.id.in_(online.keys())))
+    for user_id, payloads in online.items():
+        for payload in payloads:
+            publish(user_id, 'message', payload)
+        publish(user_id, 'unread-count', {"count": counts.get(user_id, 0)})
+
+
+def missed_messages(user_id, last_event_id):
+    """客户端携带 Last-Event-ID 重连时，取出该 ID 之后的消息（最多 REPLAY_LIMIT 条）"""
+    messages = Message.query.filter(
+        Message.user_id == user_id, Message.id > last_event_id
+    ).order_by(Message.id).limit(REPLAY_LIMIT).all()
+    return [message_payload(m) for m in messages]
+
+
+def publish_unread_count(user_id):
+    """已读、删除、清空后调用，把最新未读数同步给该用户的其他连接"""
+    if not has_subscribers(user_id):
+        return
+    count = db.session.query(User.unread_count).filter(User.id == user_id).scalar()
+    publish(user_id, 'unread-count', {"count": count or 0})
+
+
+def format_event(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def snapshot_events(unread_count, backlog=()):
+    """不能保持长连接时使用：只发送当前未读数和补发的消息，客户端按 POLL_RETRY_MS 重连"""
+    yield f"retry: {POLL_RETRY_MS}\n\n"
+    yield format_event('unread-count', {"count": unread_count})
+    for payload in backlog:
+        yield format_event('message', payload, payload['id'])
+
+
+def stream_events(subscription, unread_count, backlog=(), max_seconds=DEFAULT_MAX_SECONDS):
+    """
+    生成 SSE 数据流。连接建立时先发送当前未读数和需要补发的消息 (backlog)，之后转发订阅到的事件，
+    空闲 HEARTBEAT_SECONDS 秒发送一次心跳，每 RESYNC_SECONDS 秒校对一次未读数，
+    超过 max_seconds 秒后结束（0 表示不限制）。
+    客户端断开时生成器被关闭，在 finally 中取消订阅。
+    """
+    last_count = unread_count
+    last_resync = time.monotonic()
+    deadline = last_resync + max_seconds if max_seconds else None
+    last_id = 0
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        yield format_event('unread-count', {"count": unread_count})
+        for payload in backlog:
+            last_id = payload['id']
+            yield format_event('message', payload, payload['id'])
+        while deadline is None or time.monotonic() < deadline:
+            timeout = HEARTBEAT_SECONDS if deadline is None else min(HEARTBEAT_SECONDS, max(deadline - time.monotonic(), 0))
+            item = subscription.get(timeout=timeout)
+            if item is not None:
+                event, data = item
+                if event == 'message':
+                    # 订阅在补发查询之前建立，同一条消息可能已经补发过
+                    if data['id'] <= last_id:
+                        continue
+                    last_id = data['id']
+                    yield format_event(event, data, data['id'])
+                else:
+                    if event == 'unread-count':
+                        last_count = data['count']
+                    yield format_event(event, data)
+            else:
+                yield ": ping\n\n"
+
+            if time.monotonic() - last_resync >= RESYNC_SECONDS:
+                last_resync = time.monotonic()
+                try:
+                    count = db.session.query(User.unread_count).filter(User.id == subscription.user_id).scalar() or 0
+                finally:
+                    # 长连接期间不占用数据库连接
+                    db.session.remove()
+                if count != last_count:
+                    last_count = count
+                    yield format_event('unread-count', {"count": count})
+    finally:
+        unsubscribe(subscription)
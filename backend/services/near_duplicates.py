@@ -0,0 +1,313 @@
+"""
+评论 / 回复的近似重复检测。
+
+每条内容计算 64 位 SimHash 指纹（字符 3-gram），保存在 simhash 列中。
+进程内维护最近内容的 LSH 索引：指纹切成 4 段 16 位，按 (范围, 段号, 段值) 分桶，
+海明距离不超过 3 的两个指纹至少有一段完全相同，因此只需比较同桶内的少量候选。
+范围包括 ("user", 用户ID)、("location", 地点ID)、("review", 评论ID)。
+
+索引容量和时间窗口都有上限。首次使用时启动后台线程，从数据库最近的记录重建索引，
+之后每隔 CATCHUP_SECONDS 秒增量加载其他进程写入的新记录；查询数据库时不持有索引锁，
+检测请求不会等待加载（重建完成前只能命中已加载的部分）。
+评论、回复被删除并提交后从索引中移除。
+旧记录的 simhash 列可以用 `flask backfill-simhash` 回填，避免重建时现场计算。
+"""
+import datetime
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import bindparam, event, update
+from sqlalchemy.orm import Session
+
+from ..models.models import db, Review, ReviewReply
+
+log = logging.getLogger(__name__)
+
+SIMHASH_BITS = 64
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+# 海明距离不超过该值视为近似重复（必须小于 BANDS）
+MAX_DISTANCE = 3
+# 去掉空白和标点后短于该长度的内容不参与检测，避免 "好评" 之类的短文本误判
+MIN_TEXT_LENGTH = 8
+SHINGLE_SIZE = 3
+
+INDEX_MAX_ENTRIES = 100000
+INDEX_WINDOW_DAYS = 30
+CATCHUP_SECONDS = 5
+
+_NORMALIZE_RE = re.compile(r'[\s\W_]+', re.UNICODE)
+
+
+def _normalize(text):
+    return _NORMALIZE_RE.sub('', (text or '').lower())
+
+
+def compute_simhash(text):
+    """计算 64 位 SimHash（无符号），内容过短时返回 None"""
+    normalized = _normalize(text)
+    if len(normalized) < MIN_TEXT_LENGTH:
+        return None
+    shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+        for s in shingles
+    ]
+    # 按位统计 1 的个数：zip(*) 把每个哈希的同一位聚到一起，计数在 C 层完成
+    threshold = len(hashes) / 2
+    bits = ''.join('1' if column.count('1') > threshold else '0' for column in zip(*hashes))
+    return int(bits, 2)
+
+
+def to_signed(value):
+    """无符号 64 位 -> BIGINT 可存储的有符号值"""
+    return value - (1 << 64) if value is not None and value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value is not None and value < 0 else value
+
+
+def _bands(signature):
+    mask = (1 << BAND_BITS) - 1
+    return [(i, (signature >> (i * BAND_BITS)) & mask) for i in range(BANDS)]
+
+
+class SimHashIndex:
+    """按范围分桶的 SimHash LSH 索引，超出容量时淘汰最早加入的条目"""
+
+    def __init__(self, max_entries=INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (kind, id) -> (signature, scopes)
+        self._buckets = {}            # (scope, band, value) -> set((kind, id))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, kind, item_id, signature, scopes):
+        key = (kind, item_id)
+        if key in self._entries:
+            return
+        self._entries[key] = (signature, scopes)
+        for scope in scopes:
+            for band in _bands(signature):
+                self._buckets.setdefault((scope, *band), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    def remove(self, kind, item_id):
+        entry = self._entries.pop((kind, item_id), None)
+        if entry is not None:
+            self._discard((kind, item_id), *entry)
+
+    def _evict(self):
+        key, (signature, scopes) = self._entries.popitem(last=False)
+        self._discard(key, signature, scopes)
+
+    def _discard(self, key, signature, scopes):
+        for scope in scopes:
+            for band in _bands(signature):
+                bucket = self._buckets.get((scope, *band))
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[(scope, *band)]
+
+    def find(self, signature, scopes, max_distance=MAX_DISTANCE):
+        """返回 [(scope, kind, id, 距离)]，按距离升序"""
+        matches = {}
+        for scope in scopes:
+            for band in _bands(signature):
+                for key in self._buckets.get((scope, *band), ()):
+                    distance = (self._entries[key][0] ^ signature).bit_count()
+                    if distance <= max_distance and (scope, key) not in matches:
+                        matches[(scope, key)] = distance
+        return sorted(((scope, *key, d) for (scope, key), d in matches.items()), key=lambda m: m[3])
+
+
+_index = SimHashIndex()
+# 只保护索引本身，查询数据库期间不持有
+_lock = threading.Lock()
+_loader = None
+_last_ids = {'review': 0, 'reply': 0}
+# 本轮加载期间被删除的条目，避免加载线程把已读出的旧数据重新加入索引
+_forgotten = set()
+
+
+def _review_scopes(user_id, location_id):
+    return (('user', user_id), ('location', location_id))
+
+
+def _reply_scopes(user_id, review_id):
+    return (('user', user_id), ('review', review_id))
+
+
+def _read_since(kind, last_id, cutoff, limit):
+    """读取 id > last_id 的记录，返回 ([(id, 指纹, 范围)], 最大的 id)"""
+    if kind == 'review':
+        rows = db.session.query(
+            Review.id, Review.user_id, Review.location_id, Review.simhash, Review.comment
+        ).filter(Review.id > last_id, Review.created_at >= cutoff)
+        order_col = Review.id
+    else:
+        rows = db.session.query(
+            ReviewReply.id, ReviewReply.user_id, ReviewReply.review_id, ReviewReply.simhash, ReviewReply.content
+        ).filter(ReviewReply.id > last_id, ReviewReply.created_at >= cutoff)
+        order_col = ReviewReply.id
+    rows = rows.order_by(order_col.desc()).limit(limit).all()
+
+    entries = []
+    max_id = last_id
+    for item_id, user_id, parent_id, signature, text in reversed(rows):
+        max_id = max(max_id, item_id)
+        # 尚未回填指纹的旧记录现场计算
+        signature = to_unsigned(signature) if signature is not None else compute_simhash(text)
+        if signature is None:
+            continue
+        scopes = _review_scopes(user_id, parent_id) if kind == 'review' else _reply_scopes(user_id, parent_id)
+        entries.append((item_id, signature, scopes))
+    return entries, max_id
+
+
+def refresh_index():
+    """增量加载 id 大于上次加载位置的记录，首次调用即为重建。需在应用上下文中调用"""
+    with _lock:
+        _forgotten.clear()
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=INDEX_WINDOW_DAYS)
+    limit = INDEX_MAX_ENTRIES // 2
+    for kind in ('review', 'reply'):
+        entries, max_id = _read_since(kind, _last_ids[kind], cutoff, limit)
+        with _lock:
+            for item_id, signature, scopes in entries:
+                if (kind, item_id) not in _forgotten:
+                    _index.add(kind, item_id, signature, scopes)
+        _last_ids[kind] = max_id
+
+
+def _run(app):
+    while True:
+        with app.app_context():
+            try:
+                refresh_index()
+            except Exception as e:
+                log.warning(f"[近似重复] 加载索引失败: {e}")
+        time.sleep(CATCHUP_SECONDS)
+
+
+def _ensure_loader(app):
+    global _loader
+    if _loader is not None:
+        return
+    with _lock:
+        if _loader is None:
+            _loader = threading.Thread(target=_run, args=(app,), name='simhash-index-loader', daemon=True)
+            _loader.start()
+
+
+def find_near_duplicates(signature, scopes):
+    _ensure_loader(current_app._get_current_object())
+    with _lock:
+        return _index.find(signature, scopes)
+
+
+def check_review(text, user_id, location_id):
+    """
+    检测评论是否与最近内容近似重复。
+    返回 (指纹, 同一用户的相似评论, 同一地点其他用户的相似评论)，没有时对应项为 None。
+    """
+    signature = compute_simhash(text)
+    if signature is None:
+        return None, None, None
+    own = other = None
+    for scope, kind, item_id, _ in find_near_duplicates(signature, _review_scopes(user_id, location_id)):
+        if kind != 'review':
+            continue
+        if scope[0] == 'user' and own is None:
+            own = item_id
+        elif scope[0] == 'location' and other is None:
+            other = item_id
+    return signature, own, other
+
+
+def check_reply(text, user_id, review_id):
+    """检测回复是否与同一用户最近的回复近似重复，返回 (指纹, 相似回复ID或None)"""
+    signature = compute_simhash(text)
+    if signature is None:
+        return None, None
+    for scope, kind, item_id, _ in find_near_duplicates(signature, _reply_scopes(user_id, review_id)):
+        if kind == 'reply' and scope[0] == 'user':
+            return signature, item_id
+    return signature, None
+
+
+def remember_review(review):
+    """提交后将评论加入索引"""
+    if review.simhash is not None:
+        with _lock:
+            _index.add('review', review.id, to_unsigned(review.simhash), _review_scopes(review.user_id, review.location_id))
+
+
+def remember_reply(reply):
+    """提交后将回复加入索引"""
+    if reply.simhash is not None:
+        with _lock:
+            _index.add('reply', reply.id, to_unsigned(reply.simhash), _reply_scopes(reply.user_id, reply.review_id))
+
+
+def forget(kind, item_id):
+    """从索引中移除一条评论 ('review') 或回复 ('reply')"""
+    with _lock:
+        _index.remove(kind, item_id)
+        _forgotten.add((kind, item_id))
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_deleted(session, flush_context):
+    # 包括随评论、用户、地点级联删除的回复和评论
+    for obj in session.deleted:
+        if isinstance(obj, Review):
+            session.info.setdefault('deleted_simhash_keys', set()).add(('review', obj.id))
+        elif isinstance(obj, ReviewReply):
+            session.info.setdefault('deleted_simhash_keys', set()).add(('reply', obj.id))
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_committed_deletes(session):
+    for kind, item_id in session.info.pop('deleted_simhash_keys', ()):
+        forget(kind, item_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted_deletes(session):
+    session.info.pop('deleted_simhash_keys', None)
+
+
+def backfill_simhash(batch_size=1000):
+    """为没有指纹的旧评论和回复计算并保存 simhash，返回更新的行数。每批单独提交"""
+    updated = 0
+    for model, text_col in ((Review, Review.comment), (ReviewReply, ReviewReply.content)):
+        table = model.__table__
+        last_id = 0
+        while True:
+            rows = db.session.query(model.id, text_col).filter(
+                model.id > last_id, model.simhash.is_(None)
+            ).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            values = [{"row_id": item_id, "signature": to_signed(compute_simhash(text))} for item_id, text in rows]
+            # 内容过短的记录没有指纹，保持为空
+            values = [v for v in values if v['signature'] is not None]
+            if values:
+                db.session.execute(
+                    update(table).where(table.c.id == bindparam('row_id')).values(simhash=bindparam('signature')),
+                    values
+                )
+                updated += len(values)
+            db.session.commit()
+    return updated
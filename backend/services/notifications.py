@@ -0,0 +1,158 @@
+"""
+异步、合并的消息通知。
+
+点赞、回复、举报等操作不再直接写入 Message，而是调用 notify 登记一个事件。
+后台线程每 NOTIFY_COALESCE_SECONDS 秒处理一次积累的事件：
+- 按 (接收者, 评论, 类型) 合并，生成 "A 等 13 人赞了你的评论" 这样的一条消息；
+- 同一用户在窗口内先赞后取消，互相抵消，不产生消息；
+- 合并后的消息一次性批量写入。
+事件只保存在当前进程内存中，多进程部署时各进程分别合并。
+"""
+import atexit
+import logging
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import insert
+
+from ..models.models import db, Message, Review
+from .message_counters import bump_unread_counts
+from .message_stream import has_subscribers, message_payload, publish_messages
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COALESCE_SECONDS = 10
+
+# (recipient_id, review_id, type) -> {"location_id", "comment", "actors": {actor_id: {"name", "count"}}}
+_pending = {}
+_lock = threading.Lock()
+_dispatcher = None
+
+
+def _build_content(type, actors):
+    """根据合并后的参与者生成消息正文"""
+    latest = actors[-1]['name']
+    total = sum(a['count'] for a in actors)
+    if type == 'like':
+        if len(actors) == 1:
+            return f"你的评论收到了来自 {latest} 的一个赞"
+        return f"{latest} 等 {len(actors)} 人赞了你的评论"
+    if type == 'reply':
+        if len(actors) == 1 and total == 1:
+            return f"你的评论收到了来自 {latest} 的一条新回复"
+        if len(actors) == 1:
+            return f"你的评论收到了来自 {latest} 的 {total} 条新回复"
+        return f"你的评论收到了来自 {latest} 等 {len(actors)} 人的 {total} 条新回复"
+    if type == 'report':
+        return "你的一条评论被举报，我们将会尽快审核。"
+    return ''
+
+
+def notify(recipient_id, type, review, actor, delta=1):
+    """
+    登记一条评论相关的通知事件，应在业务事务提交后调用。
+    - delta: 点赞为 1，取消点赞为 -1
+    接收者就是操作者本人时忽略。
+    """
+    if recipient_id == actor.id:
+        return
+
+    key = (recipient_id, review.id, type)
+    with _lock:
+        group = _pending.get(key)
+        if group is None:
+            group = _pending[key] = {
+                "location_id": review.location_id,
+                "comment": (review.comment or '')[:100], # 截取前100字作为快照
+                "actors": {}
+            }
+        entry = group['actors'].pop(actor.id, {"name": actor.nickname, "count": 0})
+        entry['count'] += delta
+        group['actors'][actor.id] = entry # 重新插入，保持最近操作者在最后
+
+    app = current_app._get_current_object()
+    if app.config.get('NOTIFY_COALESCE_SECONDS', DEFAULT_COALESCE_SECONDS) <= 0:
+        flush_notifications()
+    else:
+        _ensure_dispatcher(app)
+
+
+def flush_notifications():
+    """立即处理已积累的事件，返回写入的消息数。需在应用上下文中调用。"""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+
+    # 窗口期间评论可能已被删除
+    review_ids = {review_id for _, review_id, _ in batch}
+    existing = {rid for (rid,) in db.session.query(Review.id).filter(Review.id.in_(review_ids))}
+
+    rows = []
+    for (recipient_id, review_id, type), group in batch.items():
+        actors = [a for a in group['actors'].values() if a['count'] > 0]
+        if not actors or review_id not in existing:
+            continue
+        rows.append({
+            "user_id": recipient_id,
+            "type": type,
+            "content": _build_content(type, actors),
+            "link": f"/locations/{group['location_id']}?reviewId={review_id}",
+            "related_review_id": review_id,
+            "related_comment": group['comment']
+        })
+
+    if rows:
+        # 在本进程有推送连接的用户的消息逐条写入以取得主键，用作 SSE 事件 ID；其余批量写入
+        online, offline = [], []
+        for row in rows:
+            if has_subscribers(row['user_id']):
+                online.append(Message(**row))
+            else:
+                offline.append(row)
+        db.session.add_all(online)
+        if offline:
+            db.session.execute(insert(Message), offline)
+        # 新消息都是未读的，同一事务内更新接收者的未读数
+        deltas = {}
+        for row in rows:
+            deltas[row['user_id']] = deltas.get(row['user_id'], 0) + 1
+        bump_unread_counts(deltas)
+        db.session.flush()
+        pushed = [(m.user_id, message_payload(m)) for m in online]
+        db.session.commit()
+        publish_messages(pushed)
+    return len(rows)
+
+
+def _run(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                flush_notifications()
+            except Exception as e:
+                db.session.rollback()
+                log.warning(f"[通知] 批量写入失败: {e}")
+
+
+def _flush_at_exit(app):
+    with app.app_context():
+        try:
+            flush_notifications()
+        except Exception as e:
+            log.warning(f"[通知] 退出时写入失败: {e}")
+
+
+def _ensure_dispatcher(app):
+    global _dispatcher
+    if _dispatcher is not None:
+        return
+    with _lock:
+        if _dispatcher is None:
+            interval = app.config.get('NOTIFY_COALESCE_SECONDS', DEFAULT_COALESCE_SECONDS)
+            _dispatcher = threading.Thread(target=_run, args=(app, interval), name='notification-dispatcher', daemon=True)
+            _dispatcher.start()
+            atexit.register(_flush_at_exit, app)
@@ -0,0 +1,81 @@
+"""
+基于 (排序列, id) 的游标分页工具，排序列为时间 (created_at) 或数值 (如排名分数)。
+
+游标是对上一页最后一条记录 (排序列名, 排序值, id) 的不透明编码，
+翻页时只需 WHERE 条件 + LIMIT，无需 COUNT(*) 和 OFFSET 扫描。
+排序列名用于拒绝在其他排序方式下生成的游标。
+"""
+import base64
+import datetime
+
+from sqlalchemy import and_, or_
+
+# 单页条数上限
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_key, sort_value, item_id):
+    """sort_key 为排序列名，如 'created_at'、'hot_score'"""
+    if isinstance(sort_value, datetime.datetime):
+        value = sort_value.isoformat()
+    else:
+        value = f"n:{float(sort_value or 0)!r}"
+    raw = f"{sort_key}|{value}|{item_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key):
+    """解析游标，返回 (排序值, id)；格式错误或不是按 sort_key 排序生成时抛出 InvalidCursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key, value, item_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        if key != sort_key:
+            raise ValueError(key)
+        if value.startswith('n:'):
+            return float(value[2:]), int(item_id)
+        return datetime.datetime.fromisoformat(value), int(item_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"无效的游标: {cursor}") from e
+
+
+def keyset_after(sort_col, id_col, cursor, descending=True):
+    """
+    生成“位于游标之后”的过滤条件。
+    展开为 OR 形式而不是行值比较，以便 MySQL 使用 (排序列, id) 复合索引。
+    """
+    value, item_id = decode_cursor(cursor, sort_col.key)
+    if descending:
+        return or_(sort_col < value, and_(sort_col == value, id_col < item_id))
+    return or_(sort_col > value, and_(sort_col == value, id_col > item_id))
+
+
+def clamp_page_size(page_size, default=10):
+    if not page_size or page_size < 1:
+        return default
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def paginate_keyset(query, sort_col, id_col, cursor=None, page_size=10, descending=True):
+    """
+    执行游标分页查询。
+    返回 (items, next_cursor)，没有更多数据时 next_cursor 为 None。
+    """
+    if cursor:
+        query = query.filter(keyset_after(sort_col, id_col, cursor, descending))
+    if descending:
+        query = query.order_by(sort_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(sort_col.asc(), id_col.asc())
+
+    # 多取一条用于判断是否还有下一页
+    rows = query.limit(page_size + 1).all()
+    items = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = items[-1]
+        next_cursor = encode_cursor(sort_col.key, getattr(last, sort_col.key), last.id)
+    return items, next_cursor
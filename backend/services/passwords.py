@@ -0,0 +1,80 @@
+"""
+密码哈希。
+
+scrypt / pbkdf2 是刻意设计的高开销计算，登录高峰或撞库时会占满所有 worker。
+这里把哈希计算交给一个有界线程池（hashlib 计算期间释放 GIL，可以真正并行），
+同时计算的数量不超过 PASSWORD_HASH_WORKERS，排队的请求超过上限时直接拒绝，
+其他接口的请求不会被登录请求拖慢。
+
+PASSWORD_HASH_METHOD 为当前使用的哈希参数（Werkzeug 的 method 写法）。
+调整参数后，旧参数生成的哈希会在用户下次登录成功时自动重新计算。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+DEFAULT_WORKERS = 4
+# 每个线程之外允许排队等待的请求数
+QUEUE_PER_WORKER = 4
+# 排队等待空位的最长时间（秒）
+ACQUIRE_TIMEOUT = 5
+
+_executor = None
+_slots = None
+_init_lock = threading.Lock()
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+def _pool():
+    global _executor, _slots
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                workers = current_app.config.get('PASSWORD_HASH_WORKERS', DEFAULT_WORKERS)
+                _slots = threading.BoundedSemaphore(workers * (1 + QUEUE_PER_WORKER))
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    if not slots.acquire(timeout=ACQUIRE_TIMEOUT):
+        raise PasswordHashBusy()
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def _method():
+    return current_app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # 哈希串中 $ 之前的部分，'scrypt' 这类简写会被展开为完整参数
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+def hash_password(password):
+    """在线程池中计算密码哈希，繁忙时抛出 PasswordHashBusy"""
+    return _run(generate_password_hash, password, _method())
+
+
+def verify_password(pwhash, password):
+    """在线程池中校验密码，繁忙时抛出 PasswordHashBusy"""
+    if not pwhash or password is None:
+        return False
+    return _run(check_password_hash, pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """哈希参数与当前配置不一致时返回 True"""
+    return pwhash.split('$', 1)[0] != _method_prefix(_method())
@@ -0,0 +1,171 @@
+"""
+评论的冗余计数 (like_count / reply_count) 与排名分数 (top_score / hot_score)。
+
+计数通过 UPDATE ... SET col = col ± n 原子更新，调用方负责在同一事务内提交，
+与 ReviewLike / ReviewReply 的写入保持一致。计数出现偏差时（例如级联删除）
+可以运行 `flask reconcile-review-counters` 重新计算。
+
+排名分数在同一条 UPDATE 中随计数更新，列表排序时直接走索引。记互动量 E = 点赞数 + REPLY_WEIGHT * 回复数：
+- top_score 是每天互动量的贝叶斯平均：(E + PRIOR_DAYS * m) / (曝光天数 + PRIOR_DAYS)。
+  系统不记录浏览量，用发布以来的天数（最多 EXPOSURE_CAP_DAYS 天）近似曝光；
+  先验 m 为已满曝光期的评论平均每天的互动量，相当于每条评论先有 PRIOR_DAYS 天的“平均表现”。
+  新评论的少量互动会被拉向全站平均，不会凭一两个赞排到长期高互动的评论前面；
+  超过曝光期后分母固定，按平滑后的总互动量排序；
+- hot_score = (E + 1) / (发布小时数 + 2) ^ HOT_GRAVITY，随时间衰减。
+两者都依赖发布时间，由 `flask decay-review-scores` 定期刷新仍在变化的评论。
+"""
+import datetime
+import threading
+import time
+
+from sqlalchemy import bindparam, case, func, select, update
+
+from ..models.models import db, Review, ReviewLike, ReviewReply
+
+# 一条回复相当于几个赞
+REPLY_WEIGHT = 2
+HOT_GRAVITY = 1.5
+# 超过该天数的评论热度已接近 0，不再参与定期衰减
+HOT_WINDOW_DAYS = 7
+# top_score 先验的权重（虚拟曝光天数）和最长曝光期
+PRIOR_DAYS = 3
+EXPOSURE_CAP_DAYS = 30
+# 还没有满曝光期的评论时使用的先验
+DEFAULT_PRIOR_RATE = 0.1
+PRIOR_RELOAD_SECONDS = 600
+
+_prior = None # (m, 计算时间)
+_prior_lock = threading.Lock()
+
+
+def _shifted(column, delta):
+    # 递减时不低于 0
+    return case((column + delta < 0, 0), else_=column + delta)
+
+
+def _engagement(like_count, reply_count):
+    return like_count + REPLY_WEIGHT * reply_count
+
+
+def hot_decay_factor(created_at, now=None):
+    now = now or datetime.datetime.utcnow()
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    return 1 / (age_hours + 2) ** HOT_GRAVITY
+
+
+def compute_hot_score(engagement, created_at, now=None):
+    return (engagement + 1) * hot_decay_factor(created_at, now)
+
+
+def top_score_prior(refresh=False):
+    """先验 m：满曝光期评论的平均每天互动量，按进程缓存 PRIOR_RELOAD_SECONDS 秒"""
+    global _prior
+    now = time.monotonic()
+    if not refresh and _prior is not None and now - _prior[1] < PRIOR_RELOAD_SECONDS:
+        return _prior[0]
+    with _prior_lock:
+        if refresh or _prior is None or now - _prior[1] >= PRIOR_RELOAD_SECONDS:
+            cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=EXPOSURE_CAP_DAYS)
+            mean = db.session.query(func.avg(_engagement(Review.like_count, Review.reply_count))).filter(
+                Review.created_at < cutoff
+            ).scalar()
+            _prior = (float(mean) / EXPOSURE_CAP_DAYS if mean is not None else DEFAULT_PRIOR_RATE, now)
+    return _prior[0]
+
+
+def top_score_factor(created_at, now=None):
+    """top_score = (E + PRIOR_DAYS * m) * 该系数"""
+    now = now or datetime.datetime.utcnow()
+    exposure_days = min(max((now - created_at).total_seconds() / 86400, 0), EXPOSURE_CAP_DAYS)
+    return 1 / (exposure_days + PRIOR_DAYS)
+
+
+def compute_top_score(engagement, created_at, prior=None, now=None):
+    prior = top_score_prior() if prior is None else prior
+    return (engagement + PRIOR_DAYS * prior) * top_score_factor(created_at, now)
+
+
+def bump_review_counters(review_id, likes=0, replies=0, created_at=None):
+    """
+    原子地调整评论计数并刷新排名分数，不 commit。
+    两个分数都依赖发布时间，不传 created_at 时只更新计数，分数留给定期刷新任务。
+    """
+    if not likes and not replies:
+        return
+    like_count = _shifted(Review.like_count, likes) if likes else Review.like_count
+    reply_count = _shifted(Review.reply_count, replies) if replies else Review.reply_count
+    engagement = _engagement(like_count, reply_count)
+
+    # MySQL 按书写顺序执行 SET 并读取已更新的值，因此分数放在计数之前，保证都基于旧计数计算
+    values = []
+    if created_at is not None:
+        values.append((Review.top_score, (engagement + PRIOR_DAYS * top_score_prior()) * top_score_factor(created_at)))
+        values.append((Review.hot_score, (engagement + 1) * hot_decay_factor(created_at)))
+    if likes:
+        values.append((Review.like_count, like_count))
+    if replies:
+        values.append((Review.reply_count, reply_count))
+    # 不同步会话中已加载的 Review：调用方基于加载时的计数自行推算新值
+    db.session.execute(
+        update(Review).where(Review.id == review_id).ordered_values(*values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_review_scores(now=None, batch_size=1000, all_reviews=False):
+    """
+    重新计算先验，以及仍在曝光期或热度窗口内的评论（all_reviews 为 True 时为全部评论）的
+    top_score 和 hot_score，超出热度窗口的评论热度清零。返回更新的评论数。不 commit。
+    """
+    now = now or datetime.datetime.utcnow()
+    hot_cutoff = now - datetime.timedelta(days=HOT_WINDOW_DAYS)
+    cutoff = now - datetime.timedelta(days=max(HOT_WINDOW_DAYS, EXPOSURE_CAP_DAYS))
+    prior = top_score_prior(refresh=True)
+    table = Review.__table__
+    stmt = update(table).where(table.c.id == bindparam('rid')).values(
+        top_score=bindparam('top'), hot_score=bindparam('hot')
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        query = db.session.query(Review.id, Review.like_count, Review.reply_count, Review.created_at).filter(Review.id > last_id)
+        if not all_reviews:
+            query = query.filter(Review.created_at >= cutoff)
+        rows = query.order_by(Review.id).limit(batch_size).all()
+        if not rows:
+            break
+        params = []
+        for rid, likes, replies, created_at in rows:
+            engagement = _engagement(likes or 0, replies or 0)
+            params.append({
+                "rid": rid,
+                "top": compute_top_score(engagement, created_at, prior, now),
+                "hot": compute_hot_score(engagement, created_at, now) if created_at >= hot_cutoff else 0
+            })
+        db.session.execute(stmt, params)
+        updated += len(rows)
+        last_id = rows[-1].id
+
+    if not all_reviews:
+        updated += Review.query.filter(
+            Review.created_at < cutoff, Review.hot_score != 0
+        ).update({Review.hot_score: 0}, synchronize_session=False)
+    return updated
+
+
+def reconcile_review_counters():
+    """根据 review_likes 和 review_replies 重新计算所有评论的计数和排名分数，返回计数有变化的行数"""
+    like_count = select(func.count(ReviewLike.user_id)).where(
+        ReviewLike.review_id == Review.id
+    ).scalar_subquery()
+    reply_count = select(func.count(ReviewReply.id)).where(
+        ReviewReply.review_id == Review.id
+    ).scalar_subquery()
+    updated = Review.query.filter(
+        (Review.like_count != like_count) | (Review.reply_count != reply_count)
+    ).update({
+        Review.like_count: like_count,
+        Review.reply_count: reply_count
+    }, synchronize_session=False)
+    refresh_review_scores(all_reviews=True)
+    return updated
@@ -0,0 +1,31 @@
+"""
+幂等的评论点赞写入。
+
+点赞使用 INSERT IGNORE (MySQL) / INSERT ... ON CONFLICT DO NOTHING (SQLite、PostgreSQL)，
+取消点赞使用带条件的 DELETE，都只需一条语句，不需要先 SELECT。
+根据语句影响的行数决定计数增量：重复点赞或重复取消时影响 0 行，
+不会更新 reviews 行，也就不会在热门评论上产生无谓的行锁等待。
+"""
+from sqlalchemy import delete
+
+from ..models.models import db, ReviewLike
+from .bulk import insert_ignore
+from .review_counters import bump_review_counters
+
+
+def add_review_like(user_id, review):
+    """点赞，返回是否新增了点赞记录。不 commit"""
+    inserted = insert_ignore(ReviewLike, {"user_id": user_id, "review_id": review.id})
+    if inserted:
+        bump_review_counters(review.id, likes=1, created_at=review.created_at)
+    return bool(inserted)
+
+
+def remove_review_like(user_id, review):
+    """取消点赞，返回是否删除了点赞记录。不 commit"""
+    deleted = db.session.execute(
+        delete(ReviewLike).where(ReviewLike.user_id == user_id, ReviewLike.review_id == review.id)
+    ).rowcount
+    if deleted:
+        bump_review_counters(review.id, likes=-1, created_at=review.created_at)
+    return bool(deleted)
@@ -0,0 +1,165 @@
+"""
+敏感词过滤。
+
+词表来自 SystemSetting 中的 sensitive_words（字符串数组，或按行分隔的字符串），
+以及可选的词表文件 (app.config['SENSITIVE_WORDS_FILE']，每行一个词，# 开头为注释)。
+词表编译为 Aho-Corasick 自动机，匹配耗时与文本长度成线性关系，与词数无关。
+
+每隔 RELOAD_SECONDS 秒检查一次词表是否变化（设置内容的哈希、文件修改时间），
+变化时重新编译；本进程修改设置后可调用 invalidate_sensitive_words 立即生效。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import current_app
+
+from ..models.models import db, SystemSetting
+
+log = logging.getLogger(__name__)
+
+SETTING_KEY = 'sensitive_words'
+RELOAD_SECONDS = 30
+MASK_CHAR = '*'
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机（不区分大小写）"""
+
+    def __init__(self, words):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]] # 每个状态结束的词
+        for word in words:
+            self._insert(word.lower())
+        self._build()
+
+    def _insert(self, word):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append(word)
+
+    def _build(self):
+        # 第一层状态的失败指针都指向根，从第二层开始按 BFS 计算
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                # 合并失败链上的输出，匹配时无需再沿失败链查找
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def search(self, text):
+        """返回 [(起始位置, 结束位置, 词)]，位置为原文中的字符下标，end 不含"""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            ch = ch.lower()
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for word in output[state]:
+                matches.append((i + 1 - len(word), i + 1, word))
+        return matches
+
+
+_automaton = None
+_signature = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def _load_words():
+    """读取词表，返回 (词列表, 变化标识)"""
+    words = []
+    hasher = hashlib.sha256()
+
+    setting = db.session.get(SystemSetting, SETTING_KEY)
+    if setting is not None:
+        value = setting.value
+        if isinstance(value, str):
+            # 管理后台保存时会再做一次 json.dumps
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        if isinstance(value, str):
+            value = value.splitlines()
+        if isinstance(value, list):
+            words.extend(str(w) for w in value)
+        hasher.update(json.dumps(setting.value, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+
+    path = current_app.config.get('SENSITIVE_WORDS_FILE')
+    if path and os.path.exists(path):
+        stat = os.stat(path)
+        hasher.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode('utf-8'))
+        with open(path, encoding='utf-8') as f:
+            words.extend(line for line in f if not line.lstrip().startswith('#'))
+
+    words = {w.strip() for w in words if w and w.strip()}
+    return sorted(words), hasher.hexdigest()
+
+
+def _get_automaton():
+    global _automaton, _signature, _last_check
+    now = time.monotonic()
+    if _automaton is not None and now - _last_check < RELOAD_SECONDS:
+        return _automaton
+    with _lock:
+        if _automaton is None or now - _last_check >= RELOAD_SECONDS:
+            try:
+                words, signature = _load_words()
+                if signature != _signature or _automaton is None:
+                    _automaton = AhoCorasick(words)
+                    _signature = signature
+                    log.info(f"[敏感词] 已加载 {len(words)} 个词")
+            except Exception as e:
+                # 读取失败时沿用旧词表
+                log.warning(f"[敏感词] 加载词表失败: {e}")
+                if _automaton is None:
+                    _automaton = AhoCorasick([])
+            _last_check = now
+    return _automaton
+
+
+def invalidate_sensitive_words():
+    """下次匹配时重新检查词表"""
+    global _last_check
+    _last_check = 0.0
+
+
+def find_sensitive_words(text):
+    """返回文本中的敏感词位置 [(start, end, word)]"""
+    if not text:
+        return []
+    return _get_automaton().search(text)
+
+
+def mask_sensitive_words(text, matches=None):
+    """将敏感词替换为 *，matches 为空时重新匹配"""
+    if matches is None:
+        matches = find_sensitive_words(text)
+    if not matches:
+        return text
+    chars = list(text)
+    for start, end, _ in matches:
+        for i in range(start, end):
+            chars[i] = MASK_CHAR
+    return ''.join(chars)
@@ -0,0 +1,119 @@
+"""
+批量解析标签名称。
+
+resolve_tags 一次处理一组名称：
+- 先查进程内的 名称 -> ID 缓存；
+- 未命中的名称用一条 IN 查询查找；
+- 仍不存在的批量插入（冲突时忽略，兼容并发创建），再查询一次取得 ID。
+返回的 Tag 实例直接由 ID 构造并并入当前会话，不再逐个查询。
+名称先去除首尾空白，超过 TAG_NAME_MAX_LENGTH 时抛出 InvalidTagName（INSERT IGNORE 会静默截断）；
+与 MySQL 默认排序规则一致，名称按不区分大小写匹配，"Food" 解析为已有的 "food"。
+新解析的 ID 在事务提交后才写入缓存，回滚的事务不会留下不存在的 ID。
+标签目前不会被删除，缓存只按容量整体清空。
+"""
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from ..models.models import db, Tag
+from .bulk import insert_ignore
+
+# 缓存的最大条目数，超过后整体清空
+TAG_CACHE_SIZE = 10000
+# 与 Tag.name 的列长度一致
+TAG_NAME_MAX_LENGTH = 50
+
+_tag_ids = {} # 匹配键 -> (标签ID, 库中的名称)
+_cache_lock = threading.Lock()
+
+
+class InvalidTagName(ValueError):
+    pass
+
+
+def clear_tag_cache():
+    with _cache_lock:
+        _tag_ids.clear()
+
+
+def normalize_tag_name(name):
+    """去除首尾空白，超过长度上限时抛出 InvalidTagName"""
+    name = name.strip()
+    if len(name) > TAG_NAME_MAX_LENGTH:
+        raise InvalidTagName(f"标签名称不能超过 {TAG_NAME_MAX_LENGTH} 个字符: {name}")
+    return name
+
+
+def _tag_key(name):
+    # 名称已去除首尾空白，只需忽略大小写
+    return name.lower()
+
+
+def _lookup(names):
+    """返回 {匹配键: (标签ID, 库中的名称)}"""
+    if not names:
+        return {}
+    rows = db.session.query(Tag.id, Tag.name).filter(Tag.name.in_(names)).order_by(Tag.id).all()
+    found = {}
+    for tag_id, name in rows:
+        found.setdefault(_tag_key(name), (tag_id, name))
+    return found
+
+
+def _resolve(names):
+    """返回 {规范化后的名称: (标签ID, 库中的名称)}，不存在的标签会被创建"""
+    names = {normalize_tag_name(name) for name in names}
+    names.discard('')
+    by_key = {}
+    for name in sorted(names):
+        by_key.setdefault(_tag_key(name), name)
+
+    with _cache_lock:
+        resolved = {key: _tag_ids[key] for key in by_key if key in _tag_ids}
+
+    missing = by_key.keys() - resolved.keys()
+    if missing:
+        found = _lookup([name for name in names if _tag_key(name) in missing])
+        resolved.update(found)
+        missing -= found.keys()
+    if missing:
+        insert_ignore(Tag, [{"name": by_key[key]} for key in sorted(missing)])
+        resolved.update(_lookup([by_key[key] for key in missing]))
+
+    db.session.info.setdefault('resolved_tag_ids', {}).update(resolved)
+    return {name: resolved[_tag_key(name)] for name in names if _tag_key(name) in resolved}
+
+
+def resolve_tag_ids(names):
+    """返回 {规范化后的名称: 标签ID}，不存在的标签会被创建。不 commit"""
+    return {name: tag_id for name, (tag_id, _) in _resolve(names).items()}
+
+
+@event.listens_for(Session, 'after_commit')
+def _cache_committed_tags(session):
+    resolved = session.info.pop('resolved_tag_ids', None)
+    if not resolved:
+        return
+    with _cache_lock:
+        if len(_tag_ids) + len(resolved) > TAG_CACHE_SIZE:
+            _tag_ids.clear()
+        _tag_ids.update(resolved)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_uncommitted_tags(session):
+    session.info.pop('resolved_tag_ids', None)
+
+
+def resolve_tags(names):
+    """
+    返回 {规范化后的名称: Tag}，用于直接追加到 review.tags / location.tags。不 commit
+    只有大小写不同的名称对应同一个 Tag，追加前需要去重。
+    """
+    tags = {}
+    for name, (tag_id, stored_name) in _resolve(names).items():
+        tag = Tag(id=tag_id, name=stored_name)
+        make_transient_to_detached(tag)
+        tags[name] = db.session.merge(tag, load=False)
+    return tags
@@ -0,0 +1,113 @@
+"""
+流式文件上传。
+
+使用 upload_limits 装饰的接口，multipart 中的每个文件在解析时即按块写入
+UPLOAD_FOLDER/blobs 下的临时文件，同时计算 SHA-256：
+- 单个文件超过大小限制、文件数量超限或扩展名不允许时，立即中断解析并返回 413/415；
+- 文件不会整体读入内存，之后由 image_store 去除元数据后保存到最终位置。
+未装饰的接口仍使用 Werkzeug 默认的处理方式。
+"""
+import hashlib
+import os
+import tempfile
+from functools import wraps
+
+from flask import current_app, request
+from flask.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+BLOB_SUBFOLDER = 'blobs'
+# 文本字段和 multipart 边界等额外开销
+FORM_OVERHEAD = 64 * 1024
+
+
+def upload_dir():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], BLOB_SUBFOLDER)
+
+
+class UploadStream:
+    """边写入边计算哈希的上传临时文件，写入超过 max_size 时立即中断"""
+
+    def __init__(self, directory, max_size=None):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hasher = hashlib.sha256()
+        self._max_size = max_size
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self._max_size is not None and self.size > self._max_size:
+            self.close()
+            raise RequestEntityTooLarge(f"单个文件不能超过 {self._max_size // 1024 // 1024}MB")
+        self._hasher.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hasher.hexdigest()
+
+    def detach(self):
+        """关闭文件句柄并交出临时文件路径，之后 close 不再删除该文件"""
+        self._file.close()
+        path, self.path = self.path, None
+        return path
+
+    def close(self):
+        self._file.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    # 由 upload_limits 在进入视图时设置
+    upload_max_file_size = None
+    upload_max_files = None
+    upload_allowed_extensions = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._upload_streams = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_max_file_size is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        if self.upload_max_files is not None and len(self._upload_streams) >= self.upload_max_files:
+            raise RequestEntityTooLarge(f"最多只能上传 {self.upload_max_files} 个文件")
+        if self.upload_allowed_extensions is not None:
+            ext = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+            if ext not in self.upload_allowed_extensions:
+                raise UnsupportedMediaType(f"不支持的文件格式，仅支持 {', '.join(sorted(self.upload_allowed_extensions))}")
+        if content_length is not None and content_length > self.upload_max_file_size:
+            raise RequestEntityTooLarge(f"单个文件不能超过 {self.upload_max_file_size // 1024 // 1024}MB")
+        stream = UploadStream(upload_dir(), self.upload_max_file_size)
+        self._upload_streams.append(stream)
+        return stream
+
+    def close(self):
+        # 解析中途被拒绝时，已创建的临时文件不会出现在 request.files 中，需要单独清理
+        super().close()
+        for stream in self._upload_streams:
+            stream.close()
+
+
+def upload_limits(max_file_size, max_files=1, allowed_extensions=None):
+    """
+    为接口设置上传限制，需在访问 request.files / request.form 之前生效。
+    请求总大小上限按 max_file_size * max_files 计算，Content-Length 超出时直接拒绝。
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            request.upload_max_file_size = max_file_size
+            request.upload_max_files = max_files
+            request.upload_allowed_extensions = allowed_extensions
+            request.max_content_length = max_file_size * max_files + FORM_OVERHEAD
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,185 @@
+"""
+Wiki 修订历史存储。
+
+每次正文 (rich_content) 变更都会追加一条 WikiRevision：
+- 每 WIKI_SNAPSHOT_INTERVAL 个修订保存一次完整快照；
+- 其余修订只保存相对上一修订的增量 (delta)。
+重建任意历史版本最多需要读取 1 个快照 + (WIKI_SNAPSHOT_INTERVAL - 1) 个增量。
+"""
+import difflib
+import hashlib
+import re
+
+from ..models.models import db, Admin, WikiRevision
+
+# 每隔多少个修订保存一次完整快照
+WIKI_SNAPSHOT_INTERVAL = 10
+
+# 按 HTML 标签和句末标点切分正文，保证 ''.join(tokens) == text
+_TOKEN_RE = re.compile(r'<[^>]*>?|[^<。！？；.!?;\n]+[。！？；.!?;\n]*|[。！？；.!?;\n]+')
+
+
+def _tokenize(text):
+    return _TOKEN_RE.findall(text or '')
+
+
+def _content_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def compute_delta(base, target):
+    """
+    计算从 base 到 target 的增量。
+    格式为操作列表：["c", start, end] 表示复制 base[start:end]，["i", text] 表示插入文本。
+    """
+    base_tokens = _tokenize(base)
+    target_tokens = _tokenize(target)
+
+    # base 中每个 token 的字符起始位置
+    offsets = [0]
+    for token in base_tokens:
+        offsets.append(offsets[-1] + len(token))
+
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_tokens, target_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            start, end = offsets[i1], offsets[i2]
+            # 合并相邻的复制操作
+            if ops and ops[-1][0] == 'c' and ops[-1][2] == start:
+                ops[-1][2] = end
+            else:
+                ops.append(['c', start, end])
+        elif tag in ('replace', 'insert'):
+            ops.append(['i', ''.join(target_tokens[j1:j2])])
+        # delete：不复制即可
+    return ops
+
+
+def apply_delta(base, ops):
+    """将 compute_delta 生成的增量应用到 base 上"""
+    base = base or ''
+    parts = []
+    for op in ops:
+        if op[0] == 'c':
+            parts.append(base[op[1]:op[2]])
+        else:
+            parts.append(op[1])
+    return ''.join(parts)
+
+
+def diff_contents(old, new):
+    """
+    生成两个版本之间的差异，供后台展示。
+    返回 [{"op": "equal" | "insert" | "delete", "text": ...}]
+    """
+    old_tokens = _tokenize(old)
+    new_tokens = _tokenize(new)
+    chunks = []
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            chunks.append({"op": "equal", "text": ''.join(old_tokens[i1:i2])})
+            continue
+        if i2 > i1:
+            chunks.append({"op": "delete", "text": ''.join(old_tokens[i1:i2])})
+        if j2 > j1:
+            chunks.append({"op": "insert", "text": ''.join(new_tokens[j1:j2])})
+    return chunks
+
+
+def get_latest_revision(location_id):
+    return WikiRevision.query.filter_by(location_id=location_id).order_by(
+        WikiRevision.revision_number.desc()
+    ).first()
+
+
+def reconstruct_revision(location_id, revision_number):
+    """
+    重建指定修订的完整正文。
+    只读取最近的快照及其后的增量，读取量受 WIKI_SNAPSHOT_INTERVAL 限制。
+    修订不存在时返回 None。
+    """
+    snapshot = WikiRevision.query.filter(
+        WikiRevision.location_id == location_id,
+        WikiRevision.is_snapshot.is_(True),
+        WikiRevision.revision_number <= revision_number
+    ).order_by(WikiRevision.revision_number.desc()).first()
+    if not snapshot:
+        return None
+
+    content = snapshot.snapshot or ''
+    if snapshot.revision_number == revision_number:
+        return content
+
+    chain = WikiRevision.query.filter(
+        WikiRevision.location_id == location_id,
+        WikiRevision.revision_number > snapshot.revision_number,
+        WikiRevision.revision_number <= revision_number
+    ).order_by(WikiRevision.revision_number.asc()).all()
+    if not chain or chain[-1].revision_number != revision_number:
+        return None
+
+    for revision in chain:
+        content = apply_delta(content, revision.delta or [])
+    return content
+
+
+def _add_revision(location_id, number, content, base, **fields):
+    is_snapshot = base is None or (number - 1) % WIKI_SNAPSHOT_INTERVAL == 0
+    delta = None
+    if not is_snapshot:
+        delta = compute_delta(base, content)
+        # 增量比正文本身还大时（几乎整篇重写），直接存快照更划算
+        inserted = sum(len(op[1]) for op in delta if op[0] == 'i')
+        if inserted * 2 >= len(content):
+            is_snapshot, delta = True, None
+
+    revision = WikiRevision(
+        location_id=location_id,
+        revision_number=number,
+        is_snapshot=is_snapshot,
+        snapshot=content if is_snapshot else None,
+        delta=delta,
+        content_length=len(content),
+        content_hash=_content_hash(content),
+        **fields
+    )
+    db.session.add(revision)
+    return revision
+
+
+def record_wiki_revision(location, content, editor=None, source='edit', previous_content=None,
+                         suggestion_id=None, note=None):
+    """
+    为地点追加一条修订。不 commit，由调用方统一提交。
+    - editor: 修改者 (User 或 Admin)，可为空。
+    - previous_content: 修改前的正文。地点还没有任何修订时，会先将其记录为初始版本。
+    内容与最新修订一致时不记录，返回 None。
+    """
+    content = content or ''
+    if location.id is None:
+        db.session.flush() # 新建地点需要先拿到 ID
+
+    fields = {"source": source, "suggestion_id": suggestion_id, "note": note}
+    if isinstance(editor, Admin):
+        fields["admin_id"] = editor.id
+    elif editor is not None:
+        fields["user_id"] = editor.id
+
+    latest = get_latest_revision(location.id)
+    if latest is None:
+        number = 1
+        if previous_content and previous_content != content:
+            _add_revision(location.id, number, previous_content, None, source='initial')
+            number += 1
+            base = previous_content
+        else:
+            base = None
+    else:
+        if latest.content_hash == _content_hash(content):
+            return None
+        number = latest.revision_number + 1
+        base = reconstruct_revision(location.id, latest.revision_number)
+
+    return _add_revision(location.id, number, content, base, **fields)
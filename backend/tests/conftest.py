@@ -0,0 +1,54 @@
+"""
+测试公共配置。
+
+应用在导入时读取环境变量，因此先把 DATABASE_URL 指向临时的 SQLite 文件再导入，
+避免误连开发或生产数据库。每个测试重新建表。
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+os.environ['DATABASE_URL'] = f"sqlite:///{_db_path}"
+os.environ.setdefault('SECRET_KEY', 'test-secret-key-for-pytest-only-0123456789')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.app import app as flask_app  # noqa: E402
+from backend.models.models import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, NOTIFY_COALESCE_SECONDS=0, AUDIT_LOG_FLUSH_SECONDS=0)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def queries(app):
+    """记录执行的 SQL 语句，测试中可以先 clear() 再统计"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if os.path.exists(_db_path):
+        os.remove(_db_path)
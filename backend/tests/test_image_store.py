@@ -0,0 +1,58 @@
+"""
+图片存储：原图保存前去除 EXIF，按去除后的内容去重。
+"""
+import hashlib
+import io
+import os
+
+import pytest
+
+from backend.models.models import db
+from backend.services.image_store import store_image, blob_disk_path
+
+Image = pytest.importorskip('PIL.Image')
+
+ORIENTATION = 0x0112
+MAKE = 0x010F
+GPS_IFD = 0x8825
+
+
+def _jpeg(make, orientation=6):
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[MAKE] = make
+    exif[GPS_IFD] = {2: (31.0, 12.0, 30.0), 4: (121.0, 26.0, 10.0)}
+    buf = io.BytesIO()
+    Image.new('RGB', (40, 20), 'red').save(buf, 'JPEG', exif=exif.tobytes(), quality=90)
+    buf.seek(0)
+    return buf
+
+
+@pytest.fixture
+def upload_folder(app, tmp_path):
+    previous = app.config['UPLOAD_FOLDER']
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    yield tmp_path
+    app.config['UPLOAD_FOLDER'] = previous
+
+
+def test_stored_original_has_no_exif_except_orientation(upload_folder):
+    asset, created = store_image(_jpeg('Camera A'), 'jpg')
+    db.session.commit()
+    assert created
+
+    path = blob_disk_path(asset)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert asset.sha256 == hashlib.sha256(data).hexdigest()
+    assert os.path.basename(path) == f"{asset.sha256}.jpg"
+    with Image.open(path) as img:
+        assert dict(img.getexif()) == {ORIENTATION: 6}
+
+
+def test_same_photo_with_different_metadata_is_deduplicated(upload_folder):
+    first, _ = store_image(_jpeg('Camera A'), 'jpg')
+    db.session.commit()
+    second, created = store_image(_jpeg('Camera B'), 'jpg')
+    db.session.commit()
+    assert (second.id, created) == (first.id, False)
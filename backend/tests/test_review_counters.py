@@ -0,0 +1,31 @@
+"""
+top_score 的贝叶斯平均：少量互动向先验收缩，曝光期满后按总互动量排序。
+"""
+import datetime
+
+from backend.services.review_counters import compute_top_score, EXPOSURE_CAP_DAYS
+
+NOW = datetime.datetime(2025, 6, 1)
+PRIOR = 0.5
+
+
+def _top(engagement, age_days):
+    return compute_top_score(engagement, NOW - datetime.timedelta(days=age_days), PRIOR, NOW)
+
+
+def test_new_review_without_engagement_scores_the_prior():
+    assert _top(0, 0) == PRIOR
+
+
+def test_a_few_early_likes_do_not_beat_sustained_engagement():
+    # 刚发布一小时的 2 个赞 vs 两周内稳定获得的 30 次互动
+    assert _top(2, 1 / 24) < _top(30, 14)
+
+
+def test_fast_engagement_beats_the_same_engagement_spread_over_longer():
+    assert _top(20, 2) > _top(20, 20)
+
+
+def test_exposure_is_capped():
+    assert _top(10, EXPOSURE_CAP_DAYS) == _top(10, EXPOSURE_CAP_DAYS * 4)
+    assert _top(11, EXPOSURE_CAP_DAYS * 4) > _top(10, EXPOSURE_CAP_DAYS)
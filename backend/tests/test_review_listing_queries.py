@@ -0,0 +1,97 @@
+"""
+评论列表接口的查询次数回归测试：作者、标签、回复预览、点赞状态都应批量加载，
+查询次数不随评论条数增长。
+"""
+import datetime
+
+import pytest
+
+from backend.models.models import db, User, Location, Category, Tag, Review, ReviewReply, ReviewLike
+from backend.routers.auth import create_token
+
+PAGE_SIZE = 10
+
+
+def _create_location(name, building_id, category):
+    location = Location(name=name, address=name, building_id=building_id, latitude=31.0, longitude=121.0, category=category)
+    db.session.add(location)
+    db.session.flush()
+    return location
+
+
+def _create_reviews(location, count, tags, start):
+    """每条评论由不同用户发布，各带 2 条不同用户的回复和 1 个点赞"""
+    created_at = datetime.datetime(2025, 1, 1)
+    for i in range(count):
+        author, replier, liker = (User(phone=f"1{start + i:04d}{k}00000", nickname=f"u{start + i}-{k}", password_hash="-") for k in range(3))
+        db.session.add_all([author, replier, liker])
+        db.session.flush()
+        review = Review(
+            user_id=author.id, location_id=location.id, rating=4, comment=f"评论 {i}", images=[],
+            created_at=created_at + datetime.timedelta(minutes=i), reply_count=2, like_count=1
+        )
+        review.tags.append(tags[i % len(tags)])
+        db.session.add(review)
+        db.session.flush()
+        db.session.add_all([
+            ReviewReply(review_id=review.id, user_id=replier.id, content="回复一"),
+            ReviewReply(review_id=review.id, user_id=author.id, content="回复二"),
+            ReviewLike(review_id=review.id, user_id=liker.id)
+        ])
+    db.session.commit()
+
+
+@pytest.fixture
+def locations(app):
+    category = Category(name='教学楼')
+    tags = [Tag(name='安静'), Tag(name='人多'), Tag(name='自习')]
+    db.session.add_all([category, *tags])
+    small = _create_location('小楼', 1, category)
+    large = _create_location('大楼', 2, category)
+    _create_reviews(small, 2, tags, start=0)
+    _create_reviews(large, PAGE_SIZE * 2, tags, start=100)
+    viewer = User(phone="13900000000", nickname="viewer", password_hash="-")
+    db.session.add(viewer)
+    db.session.commit()
+    return small.id, large.id, create_token(viewer.id)[0]
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'cursor': ''},
+    {'sort': 'hot', 'cursor': ''}
+], ids=['page', 'cursor', 'hot'])
+@pytest.mark.parametrize('logged_in', [False, True], ids=['anonymous', 'viewer'])
+def test_listing_query_count_is_constant(client, queries, locations, params, logged_in):
+    small_id, large_id, token = locations
+    headers = {'Authorization': f"Bearer {token}"} if logged_in else {}
+
+    def count_for(location_id):
+        db.session.remove()
+        queries.clear()
+        response = client.get('/api/reviews', query_string={'locationId': location_id, 'pageSize': PAGE_SIZE, **params}, headers=headers)
+        assert response.status_code == 200
+        return len(response.json['items']), len(queries)
+
+    count_for(small_id) # 预热，排除首次请求的初始化查询
+    small_items, small_queries = count_for(small_id)
+    large_items, large_queries = count_for(large_id)
+
+    assert (small_items, large_items) == (2, PAGE_SIZE)
+    assert small_queries == large_queries
+
+
+@pytest.mark.parametrize('with_total', [False, True], ids=['default', 'withTotal'])
+def test_cursor_listing_counts_only_on_request(client, queries, locations, with_total):
+    _, large_id, _ = locations
+    params = {'locationId': large_id, 'pageSize': PAGE_SIZE, 'cursor': ''}
+    if with_total:
+        params['withTotal'] = 1
+    queries.clear()
+    response = client.get('/api/reviews', query_string=params)
+    assert response.status_code == 200
+
+    counted = any('count(' in statement.lower() for statement in queries)
+    assert counted == with_total
+    assert response.json['total'] == (PAGE_SIZE * 2 if with_total else None)
+    assert response.json['hasMore'] is True
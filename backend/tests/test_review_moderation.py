@@ -0,0 +1,79 @@
+"""
+发布评论时的自动审核：命中敏感词的评论在公开列表中打码展示，
+与其他用户评论近似重复的评论在审核通过前不公开展示。
+"""
+import pytest
+
+from backend.models.models import db, User, Location, Category, Review, SystemSetting
+from backend.routers.auth import create_token
+from backend.services import near_duplicates
+from backend.services.sensitive_words import invalidate_sensitive_words
+
+
+@pytest.fixture(autouse=True)
+def simhash_index(monkeypatch):
+    """每个测试重新建表后 id 会重复，近似重复索引也需要清空"""
+    monkeypatch.setattr(near_duplicates, '_index', near_duplicates.SimHashIndex())
+
+
+@pytest.fixture
+def location(app):
+    category = Category(name='教学楼')
+    db.session.add(category)
+    location = Location(name='教一', address='教一', building_id=1, latitude=31.0, longitude=121.0, category=category)
+    db.session.add(location)
+    db.session.commit()
+    return location.id
+
+
+def _login(phone, nickname):
+    user = User(phone=phone, nickname=nickname, password_hash="-")
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f"Bearer {create_token(user.id)[0]}"}
+
+
+def _submit(client, headers, location_id, comment):
+    return client.post('/api/reviews', data={'locationId': location_id, 'rating': 4, 'comment': comment}, headers=headers)
+
+
+def _listing(client, location_id):
+    response = client.get('/api/reviews', query_string={'locationId': location_id})
+    assert response.status_code == 200
+    return response.json['items']
+
+
+@pytest.fixture
+def sensitive_words(app):
+    db.session.add(SystemSetting(key='sensitive_words', value=['坏词']))
+    db.session.commit()
+    invalidate_sensitive_words()
+    yield
+    invalidate_sensitive_words()
+
+
+def test_sensitive_words_are_masked_in_listing(client, location, sensitive_words):
+    headers = _login("13800000001", "作者")
+    response = _submit(client, headers, location, "这里有个坏词，环境一般")
+    assert response.status_code == 201
+
+    [item] = _listing(client, location)
+    assert item['comment'] == "这里有个**，环境一般"
+    review = db.session.get(Review, response.json['reviewId'])
+    assert '坏词' not in review.comment
+    assert '坏词' in review.reviewer_note
+
+
+def test_near_duplicate_of_other_user_is_hidden_until_approved(client, location):
+    comment = "图书馆三楼靠窗的位置很安静，插座也多，适合长时间自习，就是中午人比较多需要早点来占座"
+    original = _submit(client, _login("13800000002", "原作者"), location, comment)
+    copied = _submit(client, _login("13800000003", "搬运"), location, comment + "！")
+    assert (original.status_code, copied.status_code) == (201, 201)
+
+    review = db.session.get(Review, copied.json['reviewId'])
+    assert review.status == 'flagged'
+    assert [item['id'] for item in _listing(client, location)] == [original.json['reviewId']]
+
+    review.status = 'approved'
+    db.session.commit()
+    assert {item['id'] for item in _listing(client, location)} == {original.json['reviewId'], review.id}
@@ -149,6 +149,40 @@ export async function rejectContentReview(id: string, reason: string, type = 'su
   })
 }
 
+// Wiki revision history APIs
+/**
+ * GET /api/admin/wikis/:locationId/revisions
+ * 查询地点 Wiki 的修订列表（仅元数据，不含正文）。
+ */
+export async function getWikiRevisions(locationId: string | number, page = 1, pageSize = 20) {
+  const params = new URLSearchParams({ page: String(page), pageSize: String(pageSize) })
+  return request(`/wikis/${locationId}/revisions?${params.toString()}`, { method: 'GET' })
+}
+
+/**
+ * GET /api/admin/wikis/:locationId/revisions/:revision
+ * 获取指定修订的完整正文。
+ */
+export async function getWikiRevisionContent(locationId: string | number, revision: number) {
+  return request(`/wikis/${locationId}/revisions/${revision}`, { method: 'GET' })
+}
+
+/**
+ * GET /api/admin/wikis/:locationId/revisions/:revision/diff
+ * 对比两个修订，默认与上一修订对比。
+ */
+export async function getWikiRevisionDiff(
+  locationId: string | number,
+  revision: number,
+  against?: number,
+) {
+  const params = new URLSearchParams()
+  if (against !== undefined) params.set('against', String(against))
+  return request(`/wikis/${locationId}/revisions/${revision}/diff?${params.toString()}`, {
+    method: 'GET',
+  })
+}
+
 // Location management APIs
 export async function getLocations(page = 1, pageSize = 20, q = '', status = '', category = '') {
   const params = new URLSearchParams({ page: String(page), pageSize: String(pageSize) })
@@ -357,6 +391,9 @@ export default {
   getContentReviewDetail,
   approveContentReview,
   rejectContentReview,
+  getWikiRevisions,
+  getWikiRevisionContent,
+  getWikiRevisionDiff,
   getLocations,
   createLocation,
   updateLocation,
@@ -14,9 +14,33 @@ export interface ReviewComment {
   comment: string
   tags?: Array<string>
   images?: Array<string> // 最多9张
+  // 响应式图片：后台处理完成后提供尺寸和缩略图/中图，处理前只有原图
+  imageSet?: Array<{
+    src: string
+    width: number | null
+    height: number | null
+    thumb: string
+    srcset: { webp: string; jpeg: string } | null
+  }>
   createdAt: string
   updatedAt?: string
   likes?: number
+  // 携带登录 token 请求时返回当前用户是否已点赞
+  likedByMe?: boolean
+  replyCount?: number
+  // 只包含最早的几条回复，其余通过 getReviewReplies 分页加载
+  replies?: Array<ReviewReply>
+  // 还有更多回复时为继续加载的游标，否则为 null
+  repliesNextCursor?: string | null
+}
+
+export interface ReviewReply {
+  id: number
+  userId: number
+  userName: string
+  userAvatar?: string
+  content: string
+  createdAt: string
 }
 
 // 评论列表响应
@@ -158,6 +182,17 @@ export async function getLocationWiki(locationId: string | number): Promise<Loca
   return request(`/${locationId}/wiki`, { method: 'GET' })
 }
 
+/**
+ * 批量获取多个地点的 Wiki 详情（单次最多 50 个）
+ * @param locationIds 地点 ID 列表
+ */
+export async function getLocationWikiBatch(
+  locationIds: Array<string | number>,
+): Promise<{ items: Record<string, LocationWikiData>; missing: number[] }> {
+  const ids = encodeURIComponent(locationIds.join(','))
+  return request(`/wiki/batch?ids=${ids}`, { method: 'GET' })
+}
+
 /**
  * 获取 wiki 展示列表
  * @param params 关键字 / 标签过滤
@@ -186,18 +221,22 @@ export async function getWikiList(params?: {
   return request(`/wiki-list${suffix}`, { method: 'GET' })
 }
 
+export type ReviewSort = 'new' | 'hot' | 'top'
+
 /**
  * 获取地点评论列表
  * @param locationId 地点 ID
  * @param page 页码
  * @param pageSize 每页数量
  * @param tag 可选的标签筛选
+ * @param sort 排序方式：new（最新，默认）、hot（热门）、top（最多互动）
  */
 export async function getLocationComments(
   locationId: string | number,
   page = 1,
   pageSize = 10,
   tag?: string | null,
+  sort: ReviewSort = 'new',
 ): Promise<ReviewListResponse> {
   const params = new URLSearchParams({
     locationId: String(locationId),
@@ -209,6 +248,9 @@ export async function getLocationComments(
   if (tag) {
     params.append('tag', tag)
   }
+  if (sort !== 'new') {
+    params.append('sort', sort)
+  }
   // 使用 /api/reviews 接口
   const headers: Record<string, string> = { 'Content-Type': 'application/json' }
   const token = userAuth.getToken()
@@ -227,6 +269,29 @@ export async function getLocationComments(
   return res.json()
 }
 
+/**
+ * 分页获取评论的回复（按时间升序）
+ * @param reviewId 评论 ID
+ * @param cursor 上一页返回的 nextCursor，或评论列表中的 repliesNextCursor
+ * @param pageSize 每页数量
+ */
+export async function getReviewReplies(
+  reviewId: string | number,
+  cursor?: string | null,
+  pageSize = 20,
+): Promise<{ items: Array<ReviewReply>; nextCursor: string | null; hasMore: boolean; pageSize: number }> {
+  const params = new URLSearchParams({ pageSize: String(pageSize) })
+  if (cursor) {
+    params.append('cursor', cursor)
+  }
+  const res = await fetch(`/api/reviews/${reviewId}/replies?${params.toString()}`)
+  if (!res.ok) {
+    const err = await res.json().catch(() => ({}))
+    throw new Error(err.message || `请求失败 ${res.status}`)
+  }
+  return res.json()
+}
+
 /**
  * Wiki 建议提交接口参数
  */
@@ -427,8 +492,10 @@ export async function recordSearch(keyword: string): Promise<void> {
 
 export default {
   getLocationWiki,
+  getLocationWikiBatch,
   getWikiList,
   getLocationComments,
+  getReviewReplies,
   submitWikiSuggestion,
   createLocationWiki,
   updateLocationWiki,
@@ -134,6 +134,86 @@ export const getUserMessages = (): Promise<{ items: UserMessage[]; unreadCount:
   return request('/messages')
 }
 
+/**
+ * GET /api/user/messages/unread-count
+ * 未读消息数量（角标轮询使用，不返回消息列表）。
+ */
+export const getUnreadCount = async (): Promise<number> => {
+  const res: { count?: number } = await request('/messages/unread-count')
+  return res?.count || 0
+}
+
+export interface MessageStreamHandlers {
+  onUnreadCount?: (count: number) => void
+  onMessage?: (message: Partial<UserMessage>) => void
+}
+
+/**
+ * GET /api/user/messages/stream
+ * 订阅消息推送 (Server-Sent Events)。EventSource 无法携带 Authorization 头，
+ * 这里用 fetch 读取数据流并按 SSE 格式解析；连接断开后按服务端的 retry 间隔重连，
+ * 并携带 Last-Event-ID 让服务端补发断开期间的新消息。
+ * 返回取消订阅的函数。
+ */
+export const subscribeMessageStream = (handlers: MessageStreamHandlers): (() => void) => {
+  const controller = new AbortController()
+  let retryMs = 5000
+  let lastEventId = ''
+
+  const dispatch = (block: string) => {
+    let event = 'message'
+    const data: string[] = []
+    for (const line of block.split('\n')) {
+      if (line.startsWith('event:')) event = line.slice(6).trim()
+      else if (line.startsWith('id:')) lastEventId = line.slice(3).trim()
+      else if (line.startsWith('data:')) data.push(line.slice(5).trim())
+      else if (line.startsWith('retry:')) retryMs = Number(line.slice(6).trim()) || retryMs
+    }
+    if (!data.length) return
+    const payload = JSON.parse(data.join('\n'))
+    if (event === 'unread-count') handlers.onUnreadCount?.(payload.count)
+    else if (event === 'message') handlers.onMessage?.(payload)
+  }
+
+  const connect = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const token = userAuth.getToken()
+        const headers: Record<string, string> = {}
+        if (token) headers.Authorization = `Bearer ${token}`
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId
+        const res = await fetch(`${BASE_URL}/messages/stream`, {
+          headers,
+          signal: controller.signal,
+        })
+        if (res.status === 401) return
+        if (res.ok && res.body) {
+          const reader = res.body.getReader()
+          const decoder = new TextDecoder()
+          let buffer = ''
+          for (;;) {
+            const { value, done } = await reader.read()
+            if (done) break
+            buffer += decoder.decode(value, { stream: true })
+            let index
+            while ((index = buffer.indexOf('\n\n')) >= 0) {
+              dispatch(buffer.slice(0, index))
+              buffer = buffer.slice(index + 2)
+            }
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return
+        console.error('消息推送连接中断:', error)
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs))
+    }
+  }
+
+  connect()
+  return () => controller.abort()
+}
+
 /**
  * POST /api/user/messages/:id/read
  * 单条消息设为已读。
@@ -187,12 +267,25 @@ export interface FavoriteItem {
   type?: string
 }
 
+export interface FavoriteListResponse {
+  items: FavoriteItem[]
+  nextCursor: string | null
+  hasMore: boolean
+  pageSize: number
+}
+
 /**
- * GET /api/user/favorites
- * 收藏列表。
+ * GET /api/user/favorites?pageSize=20&cursor=xxx
+ * 收藏列表，按收藏时间倒序游标分页。翻页时传入上一页返回的 nextCursor。
  */
-export const getFavorites = (): Promise<{ items: FavoriteItem[] }> => {
-  return request('/favorites')
+export const getFavorites = (
+  params: { pageSize?: number; cursor?: string } = {},
+): Promise<FavoriteListResponse> => {
+  const search = new URLSearchParams()
+  if (params.pageSize) search.set('pageSize', String(params.pageSize))
+  if (params.cursor) search.set('cursor', params.cursor)
+  const query = search.toString()
+  return request(`/favorites${query ? `?${query}` : ''}`)
 }
 
 /**
@@ -228,6 +321,17 @@ export const getFavoriteStatus = (params: { buildingId?: number; wikiId?: number
   return request(`/favorites/status?${search.toString()}`)
 }
 
+/**
+ * POST /api/user/favorites/status
+ * 批量查询收藏状态（最多 500 个），返回其中已收藏的 buildingId。
+ */
+export const getFavoriteStatusBatch = (buildingIds: number[]): Promise<{ favorited: number[] }> => {
+  return request('/favorites/status', {
+    method: 'POST',
+    body: JSON.stringify({ buildingIds }),
+  })
+}
+
 export interface AddHistoryPayload {
   buildingId: number | string
   wikiId: number | string
@@ -263,11 +367,17 @@ export interface MyReview {
 }
 
 /**
- * GET /api/user/my-comments
- * 获取当前用户发表的评论列表
+ * GET /api/user/my-comments?pageSize=10&cursor=xxx
+ * 获取当前用户发表的评论和回复，按时间倒序游标分页。翻页时传入上一页返回的 nextCursor。
  */
-export const getMyReviews = (): Promise<{ items: MyReview[] }> => {
-  return request('/my-comments')
+export const getMyReviews = (
+  params: { pageSize?: number; cursor?: string } = {},
+): Promise<{ items: MyReview[]; nextCursor: string | null; hasMore: boolean; pageSize: number }> => {
+  const search = new URLSearchParams()
+  if (params.pageSize) search.set('pageSize', String(params.pageSize))
+  if (params.cursor) search.set('cursor', params.cursor)
+  const query = search.toString()
+  return request(`/my-comments${query ? `?${query}` : ''}`)
 }
 
 export default {
@@ -276,6 +386,8 @@ export default {
   getUserProfile,
   updateUserProfile,
   getUserMessages,
+  getUnreadCount,
+  subscribeMessageStream,
   markMessageRead,
   markAllMessagesRead,
   getBrowsingHistory,
@@ -286,4 +398,5 @@ export default {
   addFavorite,
   removeFavorite,
   getFavoriteStatus,
+  getFavoriteStatusBatch,
 }